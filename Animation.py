@@ -0,0 +1,201 @@
+"""Encoding of a sequence of drawn PIL.Image frames into animated image files"""
+from __future__ import annotations  # Annotations must not touch the lazily imported modules
+
+import json
+from io import BytesIO
+from math import ceil, sqrt
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from attrs import define, Factory
+
+from Lazy import lazy_import
+
+if TYPE_CHECKING:
+    from PIL import Image, ImageChops, PngImagePlugin
+else:
+    Image = lazy_import("PIL.Image")
+    ImageChops = lazy_import("PIL.ImageChops")
+    PngImagePlugin = lazy_import("PIL.PngImagePlugin")
+
+# File extension of each format an Animation can be saved as
+FORMAT_EXTENSIONS = {"gif": ".gif",
+                     "webp": ".webp",  # Lossless
+                     "webp_lossy": ".webp",
+                     "apng": ".png",
+                     "sprites": ".png"}  # Single sheet of all frames, indexed by a JSON text chunk
+PALETTE_SAMPLE_FRAMES: int = 8  # Frames looked at to pick the colours of a shared gif palette
+
+
+@define
+class Animation:
+    """Frames to be shown one after the other, each for its own duration in ms"""
+    frames: list[Image.Image] = Factory(list)
+    durations: list[int] = Factory(list)
+    # (left, top, right, bottom) of pixels such as a frame counter, left out when comparing frames
+    ignore_box: tuple[int, int, int, int] | None = None
+
+    @classmethod
+    def from_frames(cls, frames: list[Image.Image], duration: int,
+                    ignore_box: tuple[int, int, int, int] | None = None) -> Animation:
+        animation = cls(ignore_box=ignore_box)
+        for frame in frames:
+            animation.append(frame, duration)
+        return animation
+
+    def append(self, frame: Image.Image, duration: int) -> None:
+        """Identical consecutive frames are merged by extending how long the first is shown, so
+        only the first of them is kept within the ignore box"""
+        if self.frames and self.is_same_as_last(frame):
+            self.durations[-1] += duration
+        else:
+            self.frames.append(frame)
+            self.durations.append(duration)
+
+    def is_same_as_last(self, frame: Image.Image) -> bool:
+        last = self.frames[-1]
+        if frame is last:  # Padding repeats the very same image, so no need to compare pixels
+            return True
+        if frame.mode != last.mode or frame.size != last.size:
+            return False
+        if frame.mode == "P" and frame.getpalette() != last.getpalette():
+            return False
+        # Difference of opaque RGBA frames has zero alpha, so all bands must be checked
+        changed = ImageChops.difference(frame, last).getbbox(alpha_only=False)
+        if changed is None:
+            return True
+        if self.ignore_box is None:
+            return False
+        left, top, right, bottom = self.ignore_box
+        return left <= changed[0] and top <= changed[1] and changed[2] <= right \
+            and changed[3] <= bottom
+
+    def save(self, fp: str | BytesIO, image_format: str = "gif", delta: bool = False) -> None:
+        """Delta only applies to gifs, other formats already only store what changed"""
+        match image_format:
+            case "gif": self.save_gif(fp, delta)
+            case "webp": self.save_webp(fp, lossless=True)
+            case "webp_lossy": self.save_webp(fp, lossless=False)
+            case "apng": self.save_apng(fp)
+            case "sprites": self.save_sprite_sheet(fp)
+            case _: raise ValueError(f"Unknown image format {image_format}")
+
+    ###########
+    """ GIF """
+    ###########
+
+    def save_gif(self, fp: str | BytesIO, delta: bool = False) -> None:
+        frames = self.frames
+        # loop=0 makes gif loop better on some platforms, even if not needed for others
+        options = {"duration": self.durations, "loop": 0}
+        if delta:
+            frames, transparency = self.make_delta_frames()
+            # Each frame is drawn over the last, which is left in place (disposal=1)
+            options |= {"transparency": transparency, "disposal": 1, "optimize": False}
+        elif frames[0].mode == "P":
+            options |= {"optimize": False}  # Would otherwise split a shared palette per frame
+
+        frames[0].save(fp, format="GIF", save_all=True, append_images=frames[1:], **options)
+
+    def make_delta_frames(self) -> tuple[list[Image.Image], int]:
+        """Every frame after the first only keeps pixels that changed since the one before it,
+        the rest are made transparent so they compress down to almost nothing"""
+        frames = self.make_shared_palette_frames()
+        transparency = self.find_free_palette_index(frames)
+
+        deltas = [frames[0]]
+        for prior, frame in zip(frames, frames[1:]):
+            unchanged = ImageChops.difference(frame, prior).point(lambda x: 255 if x == 0 else 0,
+                                                                  "1")
+            delta = frame.copy()
+            delta.paste(transparency, mask=unchanged)
+            deltas.append(delta)
+        return deltas, transparency
+
+    def make_shared_palette_frames(self) -> list[Image.Image]:
+        """Frames not already drawn onto a palette are mapped onto one made from a sample of them
+        all, so colours that only turn up later are in it too. Always new images, so that
+        changing their palette leaves the animation as it was"""
+        if all(frame.mode == "P" for frame in self.frames):
+            return [frame.copy() for frame in self.frames]
+
+        palette_image = self.make_sample_image().quantize(255)
+        return [frame.convert("RGB").quantize(palette=palette_image, dither=Image.Dither.NONE)
+                for frame in self.frames]
+
+    def make_sample_image(self) -> Image.Image:
+        """Frames spread evenly from the first to the last, stacked one above the other"""
+        count = min(len(self.frames), PALETTE_SAMPLE_FRAMES)
+        step = (len(self.frames) - 1) / max(count - 1, 1)
+        samples = [self.frames[round(i * step)] for i in range(count)]
+        width, height = samples[0].size
+        sample_image = Image.new("RGB", (width, height * count))
+        for i, frame in enumerate(samples):
+            sample_image.paste(frame.convert("RGB"), (0, height * i))
+        return sample_image
+
+    def find_free_palette_index(self, frames: list[Image.Image]) -> int:
+        """Adds an entry to the palette of the given frames if there is room, so they must be
+        copies rather than the frames of the animation"""
+        palette = frames[0].getpalette() or []
+        if len(palette) < 3*256:  # Room to add one more, but palette must be shared by all
+            for frame in frames:
+                frame.putpalette(palette + [255, 0, 255])
+            return len(palette) // 3
+
+        used = [False] * 256
+        for frame in frames:
+            for index, count in enumerate(frame.histogram()[:256]):
+                used[index] |= count > 0
+        if all(used):
+            raise ValueError("Delta frames need a palette index free to use as transparency")
+        return used.index(False)
+
+    ##########################
+    """ WEBP, APNG, SPRITES """
+    ##########################
+
+    def save_webp(self, fp: str | BytesIO, lossless: bool = True) -> None:
+        # Pillow defaults to method=0, which makes files ~6x larger for barely quicker encoding.
+        # Quality is of the image when lossy, but of the compression effort when lossless
+        options = {"method": 4, "quality": 0} if lossless else {"method": 2, "quality": 80}
+        self.frames[0].save(fp, format="WEBP", save_all=True, append_images=self.frames[1:],
+                            duration=self.durations, loop=0, lossless=lossless, **options)
+
+    def save_apng(self, fp: str | BytesIO) -> None:
+        # Pillow crops each frame down to the region that changed since the last one
+        self.frames[0].save(fp, format="PNG", save_all=True, append_images=self.frames[1:],
+                            duration=self.durations, loop=0, compress_level=6)
+
+    def save_sprite_sheet(self, fp: str | BytesIO, scale: float = 1) -> dict:
+        """All frames tiled row by row onto a roughly square PNG, for web clients to play back.
+        Returns the index of where each frame is and how long it is shown for, which is also
+        stored in the PNG as a "frames" text chunk, and next to it as a .json when saved to file"""
+        width, height = (round(x*scale) for x in self.frames[0].size)
+        columns = max(1, round(sqrt(len(self.frames) * height / width)))
+        rows = ceil(len(self.frames) / columns)
+
+        palette = self.frames[0].getpalette() if self.frames[0].mode == "P" else None
+        if palette and all(x.mode == "P" and x.getpalette() == palette for x in self.frames):
+            sheet = Image.new("P", (columns*width, rows*height))
+            sheet.putpalette(palette)
+            resample = Image.Resampling.NEAREST  # Blending colours would leave the palette
+        else:
+            sheet = Image.new("RGB", (columns*width, rows*height), "White")
+            resample = Image.Resampling.LANCZOS
+
+        frames = []
+        for num, (frame, duration) in enumerate(zip(self.frames, self.durations)):
+            xy = (num % columns) * width, (num // columns) * height
+            if scale != 1:
+                frame = frame.resize((width, height), resample)
+            sheet.paste(frame if frame.mode == sheet.mode else frame.convert(sheet.mode), xy)
+            frames.append({"x": xy[0], "y": xy[1], "duration": duration})
+        index = {"frame_width": width, "frame_height": height, "columns": columns, "frames": frames}
+
+        info = PngImagePlugin.PngInfo()
+        info.add_text("frames", json.dumps(index))
+        sheet.save(fp, format="PNG", pnginfo=info)
+        if isinstance(fp, str):
+            Path(fp).with_suffix(".json").write_text(json.dumps(index))
+        return index
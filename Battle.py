@@ -1,6 +1,8 @@
 """Contains all logic for creating and resolving battles"""
+from __future__ import annotations  # Annotations must not touch the lazily imported modules
+
 from itertools import chain
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable, Iterator, TYPE_CHECKING
 
 from attrs import define, Factory, field
 
@@ -9,7 +11,15 @@ from Geography import Landscape
 from Globals import BASE_SPEED, PUSH_RESISTANCE, HALT_POWER_GRADIENT, \
                     POWER_SCALE, LOW_MORALE_POWER, PURSUE_MORALE, \
                     FILE_EMPTY, FILE_SUPPORTED, FILE_VULNERABLE, Stance, BattleOutcome
-from Unit import Army, Unit
+from Lazy import lazy_import
+from Unit import Army, LaggardIndex, Unit
+
+# Hooks are made by whoever passes them in, and snapshots only taken by some battles
+if TYPE_CHECKING:
+    import Snapshot
+    from Hooks import Hooks
+else:
+    Snapshot = lazy_import("Snapshot")
 
 
 @define(eq=False)
@@ -17,7 +27,7 @@ class FightPairs:
     """Decides which units will attack which other units and stores this as lists of tuples"""
     army_1: Army
     army_2: Army
-    _potentials: dict[Unit, set[Unit]] = field(init=False, default=Factory(dict))
+    _potentials: dict[Unit, list[Unit]] = field(init=False, default=Factory(dict))
     _assignments: dict[Unit, Unit] = field(init=False, default=Factory(dict))
     _old_assignments: dict[Unit, Unit] = field(init=False, default=Factory(dict))
     two_way_pairs: list[tuple[Unit, Unit]] = field(init=False, default=Factory(list))
@@ -52,18 +62,19 @@ class FightPairs:
         if not targets:
             return
         elif len(targets) == 1:
-            self.match_into_pair(unit, targets.pop())
+            self.match_into_pair(unit, targets[0])
         else:
             self._potentials[unit] = targets
 
-    def find_single_potentials(self, file: int, unit: Unit, opposing: Army) -> set[Unit]:
-        targets: set[Unit] = set()
+    def find_single_potentials(self, file: int, unit: Unit, opposing: Army) -> list[Unit]:
+        """In order of file, so that nothing depends on where units happen to be in memory"""
+        targets: list[Unit] = []
 
-        files = opposing.file_units.keys() if unit.all_sides else [file-1, file, file+1]
+        files = sorted(opposing.file_units) if unit.all_sides else [file-1, file, file+1]
         for file in files:
             target = opposing.file_units.get(file, None)
             if target is not None and unit.is_in_range_of(target):
-                targets.add(target)
+                targets.append(target)
 
         return targets
 
@@ -84,9 +95,11 @@ class FightPairs:
             score *= 0.5 if old_target else 1
             score *= 0.5 if target not in self._assignments else 1
 
+            # Files and side last, so that ties are always broken the same way
             return (melee and frontal, melee and old_target, melee,
                     attacker and frontal, attacker and old_target, attacker,
-                    score, abs(unit.file), abs(target.file))
+                    score, abs(unit.file), abs(target.file),
+                    unit.moving_to_pos, unit.file, target.file)
 
         unit, target = max(((unit, target)
                            for unit in self._potentials for target in self._potentials[unit]),
@@ -122,12 +135,15 @@ class Battle:
     # Class attributes, computed from Globals but unchanging
     FILE_MEAN = 0.5 * (FILE_SUPPORTED+FILE_VULNERABLE)
     FILE_DIFF = FILE_SUPPORTED - FILE_VULNERABLE
+    LAGGARD_INDEX_UNITS = 32  # Smaller armies are quicker to scan for laggards than to index
 
     army_1: Army
     army_2: Army
     landscape: Landscape
     fight_pairs: FightPairs = field(init=False)
     turns: int = field(init=False, default=0)
+    unit_ids: dict[Unit, int] = field(init=False, default=Factory(dict))  # Used by snapshots
+    hooks: Hooks | None = field(default=None, kw_only=True)  # Run around each phase if given
 
     @fight_pairs.default
     def _default_fight_pairs(self) -> FightPairs: return FightPairs(self.army_1, self.army_2)
@@ -136,6 +152,9 @@ class Battle:
         init_pos = (7 + max(self.army_1.army_reach, self.army_2.army_reach)) / 2  # >= 5
         self.army_1.set_up(-init_pos, self.landscape)
         self.army_2.set_up(init_pos, self.landscape)
+        for army in (self.army_1, self.army_2):
+            for unit in chain(army.deployed_units, army.reserves, army.removed):
+                self.unit_ids[unit] = len(self.unit_ids)
 
     #############
     """ UTILS """
@@ -163,6 +182,39 @@ class Battle:
     def reset_unit_stance(self, unit: Unit) -> None:
         unit.stance = self.get_army_deployed_in(unit).stance
 
+    def run_phase(self, phase: str, func: Callable, *args) -> None:
+        if self.hooks is None:
+            func(*args)
+        else:
+            self.hooks.run(phase, self, func, *args)
+
+    #################
+    """ SNAPSHOTS """
+    #################
+
+    def snapshot(self, detailed: bool = True) -> Snapshot.TurnSnapshot:
+        """Immutable copy of everything needed to draw or analyse the battle as it is now.
+        Effective morale and power mods of deployed units are costly, so only added if detailed"""
+        ids = self.unit_ids
+        two_way = tuple((ids[a], ids[b]) for a, b in self.fight_pairs.two_way_pairs)
+        one_way = tuple((ids[a], ids[b]) for a, b in self.fight_pairs.one_way_pairs)
+        return Snapshot.TurnSnapshot(self.turns, self.snapshot_army(self.army_1, 1, detailed),
+                                     self.snapshot_army(self.army_2, 2, detailed), two_way,
+                                     one_way)
+
+    def snapshot_army(self, army: Army, num: int, detailed: bool = True) -> Snapshot.ArmySnapshot:
+        ids = self.unit_ids
+        from_unit = Snapshot.UnitSnapshot.from_unit
+        if detailed:
+            deployed = tuple(from_unit(unit, ids[unit], num, self.get_eff_morale(unit),
+                                       self.get_power_mods(unit))
+                             for unit in army.deployed_units)
+        else:
+            deployed = tuple(from_unit(unit, ids[unit], num) for unit in army.deployed_units)
+        reserves = tuple(from_unit(unit, ids[unit], num) for unit in army.reserves)
+        removed = tuple(from_unit(unit, ids[unit], num) for unit in army.removed)
+        return Snapshot.ArmySnapshot(deployed, reserves, removed)
+
     #################
     """ CORE LOOP """
     #################
@@ -171,17 +223,32 @@ class Battle:
         if verbosity >= 10:
             self.print_turn()
 
-        while not self.is_battle_ended():
-            self.turns += 1
-            self.do_turn(verbosity)
+        for _ in self.iter_turn_numbers(verbosity):
+            pass
 
         self.print_result(verbosity)
         return self.decide_winner()
 
+    def iter_turns(self, verbosity: int = 0, detailed: bool = False
+                   ) -> Iterator[Snapshot.TurnSnapshot]:
+        """Fights the battle one turn at a time, yielding a snapshot at the end of each. Stopping
+        early leaves the battle at that turn, and calling again carries on from there.
+        Call snapshot() beforehand for the starting state"""
+        for _ in self.iter_turn_numbers(verbosity):
+            yield self.snapshot(detailed)
+
+    def iter_turn_numbers(self, verbosity: int = 0) -> Iterator[int]:
+        """Same as iter_turns, but only yields the number of each turn once done, for when the
+        snapshot is not needed"""
+        while not self.is_battle_ended():
+            self.turns += 1
+            self.run_phase("turn", self.do_turn, verbosity)
+            yield self.turns
+
     def do_turn(self, verbosity: int) -> None:
-        self.tidy()
-        self.fight()
-        self.move()
+        self.run_phase("tidy", self.tidy)
+        self.run_phase("fight", self.fight)
+        self.run_phase("move", self.move)
         if verbosity >= 100:
             self.print_turn()
 
@@ -248,7 +315,7 @@ class Battle:
     ################
 
     def fight(self) -> None:
-        self.fight_pairs.assign_all()
+        self.run_phase("assign_all", self.fight_pairs.assign_all)
 
         for unit_A, unit_B in self.fight_pairs.two_way_pairs:
             self.fight_two_way(unit_A, unit_B)
@@ -367,7 +434,7 @@ class Battle:
         coef = min(1, (advantage - 1) / (PUSH_RESISTANCE + loser.rigidity))
         dist = min(winner.eff_speed, loser.eff_speed * coef)
         dist *= BASE_SPEED * DELTA_T * (1 if winner.moving_to_pos else -1)
-        loser.position += dist
+        loser.move_by(dist)
         self._follow_push_by_winner(winner, loser, dist)
 
     def _follow_push_by_winner(self, winner: Unit, loser: Unit, dist: float) -> None:
@@ -379,26 +446,40 @@ class Battle:
         loser_in_range = loser.is_in_range_of(winner, melee=loser_force_melee)
 
         if not winner_in_range or not loser_in_range:
-            winner.position += dist
+            winner.move_by(dist)
 
     ##############
     """ MOVING """
     ##############
 
     def move(self) -> None:
-        for unit in self.get_move_order():
-            if unit.forced_move_towards:
-                target = unit.get_position_to_attack_target(unit.forced_move_towards, True)
-                self.move_unit_in_stance(unit, target)
+        """Each unit only moves itself, so the laggard indexes stay exact by updating it alone"""
+        laggards = {army: LaggardIndex(army.deployed_units) for army in (self.army_1, self.army_2)
+                    if len(army.file_units) >= self.LAGGARD_INDEX_UNITS}
+        for army, index in laggards.items():
+            army.laggards = index
+        try:
+            for unit in self.get_move_order():
+                self.move_unit(unit)
+                if laggards and (moved := laggards.get(self.get_army_deployed_in(unit))):
+                    moved.update(unit)
+        finally:
+            for army in laggards:
+                army.laggards = None
+
+    def move_unit(self, unit: Unit) -> None:
+        if unit.forced_move_towards:
+            target = unit.get_position_to_attack_target(unit.forced_move_towards, True)
+            self.move_unit_in_stance(unit, target)
 
-            else:
-                army = self.get_army_deployed_in(unit)
-                enemy = self.get_other_army(army).get_blocking_unit(unit)
-                if not enemy:
-                    unit.move_towards(-unit.init_pos, unit.eff_speed)
-                elif not unit.is_in_range_of(enemy):
-                    target = unit.get_position_to_attack_target(enemy, False)
-                    self.move_unit_in_stance(unit, target)
+        else:
+            army = self.get_army_deployed_in(unit)
+            enemy = self.get_other_army(army).get_blocking_unit(unit)
+            if not enemy:
+                unit.move_towards(-unit.init_pos, unit.eff_speed)
+            elif not unit.is_in_range_of(enemy):
+                target = unit.get_position_to_attack_target(enemy, False)
+                self.move_unit_in_stance(unit, target)
 
     def get_move_order(self) -> list[Unit]:
         """Move melee units in centre first (last two are to break tie)"""
@@ -0,0 +1,80 @@
+"""Persistent on-disk caches, so work repeated between runs or battles is only done once"""
+import json
+import os
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+
+from attrs import define, field, fields, has
+
+from Config import CACHE_MAX_BYTES
+
+
+def stable_hash(obj: Any) -> str:
+    """Hex digest which only depends on the content of obj, the same across runs and platforms"""
+    text = json.dumps(to_canonical(obj), separators=(",", ":"))
+    return sha256(text.encode()).hexdigest()
+
+
+def to_canonical(obj: Any) -> Any:
+    """Converts to only json types, with dicts as lists of pairs ordered by their content.
+    Ints are floats so that equal numbers hash the same whichever type they were written as"""
+    if isinstance(obj, bool) or obj is None or isinstance(obj, str):
+        return obj
+    elif isinstance(obj, (int, float)):
+        return float(obj)
+    elif isinstance(obj, dict):
+        pairs = [[to_canonical(k), to_canonical(v)] for k, v in obj.items()]
+        return sorted(pairs, key=lambda pair: json.dumps(pair[0]))
+    elif isinstance(obj, (list, tuple)):
+        return [to_canonical(x) for x in obj]
+    elif has(type(obj)):
+        return [type(obj).__name__] + [to_canonical(getattr(obj, x.name))
+                                       for x in fields(type(obj))]
+    else:
+        raise TypeError(f"Cannot canonicalize {type(obj)}")
+
+
+@define
+class DiskCache:
+    """Bytes stored as one file per key in a directory. Once the files add up to more than
+    max_bytes, the least recently used are deleted"""
+    directory: Path = field(converter=Path)
+    max_bytes: int = CACHE_MAX_BYTES
+    suffix: str = ".bin"
+
+    def get_path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> bytes | None:
+        path = self.get_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # Modification time doubles up as time last used
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.get_path(key)
+        temp = path.with_suffix(f".{os.getpid()}.tmp")  # Never leave a half written entry
+        temp.write_bytes(data)
+        os.replace(temp, path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Evicted by another process in the meantime
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -11,3 +11,8 @@ FRAME_COUNTER = True
 
 """Duration of each frame in ms"""
 FRAME_MS = 50
+
+"""Where rendered backgrounds (and similar repeatable work) are cached between runs, and how many
+bytes each cache may hold before its least recently used entries are evicted"""
+CACHE_DIR = ".battle_cache"
+CACHE_MAX_BYTES = 64 * 2**20
@@ -0,0 +1,76 @@
+"""Streaming of battles as they are fought, as JSON Lines that other tools can read turn by turn"""
+import json
+from typing import Self, TextIO
+
+from attrs import define, Factory, field
+
+from Battle import Battle
+from Globals import BattleOutcome
+from Snapshot import TurnSnapshot
+
+CHUNK_TURNS: int = 100  # Turns kept in memory before being written out together
+DECIMALS: int = 4       # Morale and power mods are rounded to this many, positions already are
+
+
+@define
+class TurnWriter:
+    """Writes one compact JSON object per turn. Deployed units are given column by column, so each
+    field name appears once per turn: {"turn": 3, "id": [0, 1], "army": [1, 2], "file": [0, 0],
+    "position": [...], "morale": [...], "eff_morale": [...], "power_mods": [...], "stance": [...],
+    "halted": [...], "removed": [ids], "two_way": [[id, id]], "one_way": [[attacker, target]]}"""
+    stream: TextIO
+    chunk_turns: int = CHUNK_TURNS
+    _lines: list[str] = field(init=False, default=Factory(list))
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+
+    def write(self, snapshot: TurnSnapshot) -> None:
+        self._lines.append(json.dumps(snapshot_to_dict(snapshot), separators=(",", ":")) + "\n")
+        if len(self._lines) >= self.chunk_turns:
+            self.flush()
+
+    def flush(self) -> None:
+        self.stream.write("".join(self._lines))
+        self.stream.flush()
+        self._lines = []
+
+
+def snapshot_to_dict(snapshot: TurnSnapshot) -> dict:
+    """Effective morale and power mods are missing from snapshots that are not detailed"""
+    units = [unit for army in snapshot.armies for unit in army.deployed]
+    return {"turn": snapshot.turn,
+            "id": [x.id for x in units],
+            "army": [x.army for x in units],
+            "file": [x.file for x in units],
+            "position": [x.position for x in units],
+            "morale": [round(x.morale, DECIMALS) for x in units],
+            "eff_morale": [round_or_none(x.eff_morale) for x in units],
+            "power_mods": [round_or_none(x.power_mods) for x in units],
+            "stance": [x.stance.value for x in units],
+            "halted": [x.halted for x in units],
+            "removed": [x.id for army in snapshot.armies for x in army.removed],
+            "two_way": snapshot.two_way_pairs,
+            "one_way": snapshot.one_way_pairs}
+
+
+def round_or_none(value: float | None) -> float | None:
+    return None if value is None else round(value, DECIMALS)
+
+
+def export_battle(battle: Battle, fp: str | TextIO, chunk_turns: int = CHUNK_TURNS,
+                  detailed: bool = True) -> BattleOutcome:
+    """Fights the battle, writing its starting state and then every turn as soon as it is done.
+    Takes a file name, or any open text stream such as sys.stdout to pipe it elsewhere"""
+    if isinstance(fp, str):
+        with open(fp, "w", encoding="utf-8") as stream:
+            return export_battle(battle, stream, chunk_turns, detailed)
+
+    with TurnWriter(fp, chunk_turns) as writer:
+        writer.write(battle.snapshot(detailed))
+        for snapshot in battle.iter_turns(detailed=detailed):
+            writer.write(snapshot)
+    return battle.decide_winner()
@@ -1,4 +1,6 @@
 """Contains all elements related to terrain, landscapes, and maps the battle takes place on"""
+from collections import Counter
+from math import inf
 from typing import Callable
 
 from attrs import define, Factory, field, validators
@@ -18,6 +20,9 @@ class Terrain:
 
 DEFAULT_TERRAIN = Terrain("Undefined", "White")
 
+# Counters of calls to landscape queries, by query. Empty unless profiling, see Hooks.QueryCounter
+query_counters: list[Counter[str]] = []
+
 
 @define
 class Landscape:
@@ -38,6 +43,18 @@ class Landscape:
     # {(file, pos): height} - height at other locations interpolated from these
     height_map: dict[tuple[float, float], float] = field(default=Factory(dict))
 
+    def mirrored(self, files: bool = False, positions: bool = False) -> "Landscape":
+        """Copy reflected about file 0 and/or position 0. Terrain bounds are upper limits, so
+        positions exactly on one belong to the other side of it once reflected"""
+        terrain_map = self.terrain_map
+        if positions:
+            terrain_map = {file: flip_terrain_bounds(x) for file, x in terrain_map.items()}
+        if files:
+            terrain_map = {-file: x for file, x in terrain_map.items()}
+        height_map = {(-file if files else file, -pos if positions else pos): height
+                      for (file, pos), height in self.height_map.items()}
+        return Landscape(terrain_map, height_map)
+
     def get_terrain(self, file: int, pos: float) -> Terrain:
         file_map = self.terrain_map.get(file, {})
         for pos_bound, terrain in file_map.items():
@@ -58,6 +75,8 @@ class Landscape:
 
     def accumulate_over_terrain(self, file: int, pos: float, method: Callable[[Terrain], float]
                                 ) -> float:
+        if query_counters:
+            count_query("accumulate_over_terrain")
         min_pos, max_pos = pos-0.5, pos+0.5
         total = 0.0
 
@@ -72,6 +91,8 @@ class Landscape:
 
     # File is a float rather than int here for drawing purposes
     def get_height(self, file: float, pos: float) -> float:
+        if query_counters:
+            count_query("get_height")
         ref_points = self.sort_nearest_points(file, pos)
         num_points = len(ref_points)
 
@@ -105,3 +126,21 @@ class Landscape:
 
     def calc_sep_square(self, file_A: float, pos_A: float, file_B: float, pos_B: float) -> float:
         return ((file_A-file_B)*FILE_WIDTH)**2 + (pos_A-pos_B)**2
+
+
+def count_query(query: str) -> None:
+    for counter in query_counters:
+        counter[query] += 1
+
+
+def flip_terrain_bounds(file_map: dict[float, Terrain]) -> dict[float, Terrain]:
+    """Terrain going up to each bound from the previous one, reflected about position 0"""
+    if not file_map:
+        return {}
+    bounds = list(file_map)
+    terrains = list(file_map.values())
+    flipped = {} if bounds[-1] == inf else {-bounds[-1]: DEFAULT_TERRAIN}
+    for bound, terrain in zip(reversed(bounds[:-1]), reversed(terrains[1:])):
+        flipped[-bound] = terrain
+    flipped[inf] = terrains[0]
+    return flipped
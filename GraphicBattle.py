@@ -1,17 +1,30 @@
 """Wrapper around Battle to display battles graphically as a series of PIL.Image frames"""
+from __future__ import annotations  # Annotations must not touch the lazily imported modules
+
 from io import BytesIO
 from math import atan2, inf, sqrt, pi
+from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
-import numpy as np
-from attrs import define, Factory, field
-from PIL import Image, ImageColor, ImageDraw
+from attrs import define, Factory, field, validators
 
-from Config import FRAME_COUNTER, FRAME_MS
+from Animation import Animation, FORMAT_EXTENSIONS
+from Config import DELTA_T, FRAME_COUNTER, FRAME_MS
 from Battle import Battle
+from Cache import DiskCache, stable_hash
 from Geography import DEFAULT_TERRAIN, Landscape
 from Globals import FILE_WIDTH, Stance, BattleOutcome
-from Unit import Army, Unit
+from Lazy import lazy_import
+from Snapshot import ArmySnapshot, TurnSnapshot, UnitSnapshot
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image, ImageColor, ImageDraw, ImageFont
+else:  # Only loaded on first render, so headless battles never pay for them
+    np = lazy_import("numpy")
+    Image = lazy_import("PIL.Image")
+    ImageColor = lazy_import("PIL.ImageColor")
+    ImageDraw = lazy_import("PIL.ImageDraw")
+    ImageFont = lazy_import("PIL.ImageFont")
 
 # Visual constants
 UNIT_FILE_WIDTH: float = 0.95    # Width of unit relative to file
@@ -20,6 +33,15 @@ FONT_SIZE_FRAC: float = 0.45     # Font size relative to unit pixel height
 HALF_ARROWHEAD_SIZE: int = 5     # Size of fight arrowhead in pixels
 BORDER_WIDTH: int = 2            # Width of lines forming unit rectangles
 ARROW_WIDTH: int = 3             # Width of lines for fight arrows
+CONTOUR_DOT_SPACING: int = 6     # Pixels between dots along contour lines
+CONTOUR_DOT_SIZE: int = 2        # Width and height of contour dots in pixels
+CONTOUR_ROWS_PER_CHUNK: int = 64  # Pixel rows of heights computed at once, to cap memory use
+BACKGROUND_VERSION: int = 1      # Increase whenever backgrounds change, to miss old cached ones
+MAX_TEXT_STAMPS: int = 4096      # Rendered strings kept for reuse, cleared once this many
+DIGITS: str = "0123456789"       # Glyphs the frame counter can contain
+MAX_UNIT_SPRITES: int = 1024     # Rendered unit images kept for reuse, cleared once this many
+PREVIEW_SCALE: float = 0.4       # Resolution of previews relative to max_pixels_x
+PREVIEW_FRAME_STEP: int = 3      # Previews only draw one in this many frames
 
 
 @define
@@ -31,6 +53,15 @@ class Scene:
     max_file: int
     min_pos: float
     max_pos: float
+    army_colors: tuple[str, str] = field(default=("Black", "Black"))
+    # "P" draws straight onto a shared palette, so frames need no quantizing when saved as gifs
+    mode: str = field(default="RGBA", validator=validators.in_(("RGBA", "P")))
+    # "numpy" rasterizes contours directly, "matplotlib" (if installed) plots and pastes them
+    contour_method: str = field(default="numpy", validator=validators.in_(("numpy", "matplotlib")))
+    background_cache: DiskCache | None = field(default=None, repr=False)
+    # "numpy" keeps frames as arrays and alpha blends onto them, only making images to save them
+    backend: str = field(default="pillow", validator=validators.in_(("pillow", "numpy")))
+    detailed: bool = True  # False leaves out contour lines and height labels, for quick previews
 
     drawn_file_width: float = field(init=False)
     pixel_per_pos: float = field(init=False)
@@ -38,12 +69,29 @@ class Scene:
     pixels_unit: tuple[int, int] = field(init=False)
     croped_res: tuple[int, int] = field(init=False)
     font_size: int = field(init=False)
+    palette: list[int] | None = field(init=False, default=None)
+    fonts: dict[int, ImageFont.FreeTypeFont | ImageFont.ImageFont] = field(
+        init=False, default=Factory(dict), repr=False)
+    text_stamps: dict[tuple[str, int, str, str], tuple[Image.Image, tuple[int, int]]] = field(
+        init=False, default=Factory(dict), repr=False)
+    # Image for the pillow backend, (premultiplied color, 1 - alpha) arrays for the numpy one
+    unit_sprites: dict[tuple, Image.Image | tuple[np.ndarray, np.ndarray]] = field(
+        init=False, default=Factory(dict), repr=False)
 
     background: Image.Image = field(init=False, default=None)
     canvas: Image.Image = field(init=False, default=None)
     frames: list[Image.Image] = field(init=False, default=Factory(list))
+    # Box around every frame counter drawn, for Animation to leave out when comparing frames
+    counter_box: tuple[int, int, int, int] | None = field(init=False, default=None)
+    counter_length: int = field(init=False, default=0)  # Of the longest count drawn, with its space
+    background_array: np.ndarray = field(init=False, default=None, repr=False)
+    canvas_array: np.ndarray = field(init=False, default=None, repr=False)
+    frame_arrays: list[np.ndarray] = field(init=False, default=Factory(list), repr=False)
 
     def __attrs_post_init__(self) -> None:
+        if self.backend == "numpy" and self.mode == "P":
+            raise ValueError("The numpy backend blends colors, which cannot be done on a palette")
+
         num_files = 1 + self.max_file - self.min_file  # Count files, not gaps
         num_pos = 4 + self.max_pos - self.min_pos      # Including space for reserves and dead
         
@@ -64,7 +112,9 @@ class Scene:
 
         self.pixels_unit = int(UNIT_FILE_WIDTH * self.pixel_per_file), int(self.pixel_per_pos)
         self.croped_res = int(self.pixel_per_file * num_files), int(self.pixel_per_pos * num_pos)
-        
+
+        if self.mode == "P":
+            self.palette = self.make_palette()
         self.draw_background()
 
     # GETTERS
@@ -80,22 +130,149 @@ class Scene:
         c2 = ImageColor.getrgb(color_2)
         return tuple((c1[i]+c2[i]) // 2 for i in range(3))
 
+    # PALETTE
+    def make_palette(self) -> list[int]:
+        """Every color that can be drawn is known in advance, so a single palette shared by all
+        frames is built once. Blends of terrain with the contour and label colors are added
+        so the anti-aliased background maps onto it without banding"""
+        colors: list[tuple[int, ...]] = []
+
+        def add(color: str | tuple[int, ...]) -> None:
+            rgb = ImageColor.getrgb(color) if isinstance(color, str) else color
+            if rgb[:3] not in colors:
+                colors.append(rgb[:3])
+
+        for name in ("White", "Black", "Gainsboro", "Gray", "DimGray", *self.army_colors):
+            add(name)
+        add(self.blend_colors(*self.army_colors))
+
+        terrains = {DEFAULT_TERRAIN.color}
+        terrains |= {x.color for file_map in self.landscape.terrain_map.values()
+                     for x in file_map.values()}
+        for color in sorted(terrains):
+            add(color)
+
+        for color in sorted(terrains | {"Gainsboro"}):
+            base = ImageColor.getrgb(color)
+            for ink in (ImageColor.getrgb("DimGray"), ImageColor.getrgb("Black")):
+                for frac in (0.25, 0.5, 0.75):
+                    add(tuple(int(base[i] + frac*(ink[i]-base[i])) for i in range(3)))
+
+        if len(colors) > 256:
+            raise ValueError(f"{len(colors)} colors required, but a palette holds only 256")
+        return [channel for color in colors for channel in color]
+
+    def new_image(self, color: str) -> Image.Image:
+        image = Image.new(mode=self.mode, size=self.croped_res, color=color)
+        if self.palette:
+            image.putpalette(self.palette)
+        return image
+
+    # TEXT
+    def get_font(self, size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+        if size not in self.fonts:
+            self.fonts[size] = ImageFont.load_default(size)
+        return self.fonts[size]
+
+    def draw_text(self, draw: ImageDraw.ImageDraw, xy: tuple[float, float], text: str,
+                  color: str | tuple[int, ...], size: int, anchor: str) -> None:
+        """Same as ImageDraw.text, but the glyphs of each string are only rendered the first time
+        and then reused as a mask, as the same names and numbers are drawn every frame"""
+        if not text:
+            return
+        stamp, (left, top) = self.get_text_stamp(text, size, anchor, draw.mode)
+        draw.bitmap((int(xy[0]) + left, int(xy[1]) + top), stamp, fill=color)
+
+    def get_text_stamp(self, text: str, size: int, anchor: str, mode: str
+                       ) -> tuple[Image.Image, tuple[int, int]]:
+        stamp_mode = "1" if mode == "P" else "L"  # Palette indices cannot be blended
+        key = (text, size, anchor, stamp_mode)
+        if key not in self.text_stamps:
+            if len(self.text_stamps) >= MAX_TEXT_STAMPS:
+                self.text_stamps.clear()
+            self.text_stamps[key] = self.make_text_stamp(text, size, anchor, stamp_mode)
+        return self.text_stamps[key]
+
+    def make_text_stamp(self, text: str, size: int, anchor: str, stamp_mode: str
+                        ) -> tuple[Image.Image, tuple[int, int]]:
+        """Mask of the text, and the offset to draw it at from where the text is anchored"""
+        font = self.get_font(size)
+        left, top, right, bottom = font.getbbox(text, mode=stamp_mode, anchor=anchor)
+        stamp = Image.new(mode=stamp_mode, size=(int(right-left), int(bottom-top)))
+        ImageDraw.Draw(stamp).text((-left, -top), text, fill=255, font=font, anchor=anchor)
+        return stamp, (int(left), int(top))
+
+    def draw_counter(self, xy: tuple[float, float], count: int, size: int) -> None:
+        """Drawn whole rather than from cached stamps, as each count is only drawn once, and
+        digit by digit would not quite be where Pillow puts each glyph of the whole string"""
+        text = f" {count}"
+        if self.backend == "numpy":
+            stamp, (left, top) = self.make_text_stamp(text, size, "lt", "L")
+            color = Image.new(mode="RGBA", size=stamp.size, color="Black")
+            color.putalpha(stamp)
+            self.blend_onto_canvas_array(self.to_blend_arrays(color),
+                                         (int(xy[0]) + left, int(xy[1]) + top))
+        else:
+            ImageDraw.Draw(self.canvas).text(xy, text, fill="Black", font=self.get_font(size),
+                                             anchor="lt")
+
+        if len(text) > self.counter_length:  # Counts only go up, so the box only grows with them
+            self.counter_length = len(text)
+            font = self.get_font(size)
+            boxes = [font.getbbox(" " + digit*len(str(count)), anchor="lt") for digit in DIGITS]
+            # A pixel of margin all round, as glyphs may be a pixel lower next to other digits
+            self.counter_box = (int(xy[0] + min(box[0] for box in boxes)) - 1,
+                                int(xy[1] + min(box[1] for box in boxes)) - 1,
+                                int(xy[0] + max(box[2] for box in boxes)) + 1,
+                                int(xy[1] + max(box[3] for box in boxes)) + 1)
+
     # BACKGROUND
     def draw_background(self) -> None:
+        """Same inputs always draw the same background, so it can be reused from the cache"""
+        if self.background_cache is None:
+            self.render_background()
+            return
+
+        key = stable_hash(self.get_background_inputs())
+        data = self.background_cache.get(key)
+        if data is not None:
+            self.background = Image.open(BytesIO(data))
+            self.background.load()
+        else:
+            self.render_background()
+            buffer = BytesIO()
+            self.background.save(buffer, format="PNG", compress_level=1)
+            self.background_cache.put(key, buffer.getvalue())
+
+    def get_background_inputs(self) -> list:
+        return [BACKGROUND_VERSION, Image.__version__, self.max_pixels_x, self.mode,
+                self.palette, self.contour_method, self.detailed, self.min_file, self.max_file,
+                self.min_pos, self.max_pos, self.landscape.terrain_map, self.landscape.height_map]
+
+    def render_background(self) -> None:
         self.background = Image.new(mode="RGBA", size=self.croped_res, color="Gainsboro")
 
         for file in range(self.min_file, self.max_file + 1):
             self.draw_background_file(file)
 
-        buffer = self.plot_contour_graph()
-        self.draw_contour_graph_on_background(buffer)
-        self.draw_background_height_labels()
+        if self.detailed:
+            if self.contour_method == "matplotlib":
+                buffer = self.plot_contour_graph()
+                self.draw_contour_graph_on_background(buffer)
+            else:
+                self.draw_contour_lines_on_background()
+            self.draw_background_height_labels()
+
+        if self.palette:  # Quantized once here, rather than every frame when saving
+            palette_image = self.new_image("White")
+            self.background = self.background.convert("RGB").quantize(
+                palette=palette_image, dither=Image.Dither.NONE)
 
     def draw_background_file(self, file: int) -> None:
         draw = ImageDraw.Draw(self.background)
         pos_prior = -inf
 
-        file_map = self.landscape.terrain_map.get(file, {})
+        file_map = dict(self.landscape.terrain_map.get(file, {}))
         if inf not in file_map:
             file_map[inf] = DEFAULT_TERRAIN
 
@@ -105,11 +282,69 @@ class Scene:
             draw.rectangle((*top, *bot), fill=terrain.color)
             pos_prior = pos
 
-    def plot_contour_graph(self) -> BytesIO:
-        X, Y, h = self.make_vectors_for_contour_graph()
+    def get_contour_levels(self, h: np.ndarray) -> np.ndarray:
         levels = np.arange(np.min(h), np.max(h), 1)
         if len(levels) <= 4:
             levels = np.arange(np.min(h), np.max(h), 0.5)
+        return levels
+
+    def draw_contour_lines_on_background(self) -> None:
+        """Finds where the height crosses a contour level between neighbouring pixels, and draws
+        dots along those edges. Dots are spaced along whichever axis the line runs closest to"""
+        left, top = self.get_coords(self.min_file-0.5, self.min_pos)
+        right, bot = self.get_coords(self.max_file+0.5, self.max_pos)
+        # Coordinates at the centre of every pixel of the map
+        files = self.min_file - 0.5 + (np.arange(right-left) + 0.5) / self.pixel_per_file
+        positions = self.min_pos + (np.arange(bot-top) + 0.5) / self.pixel_per_pos
+        h = self.calc_height_grid(files, positions)
+
+        levels = self.get_contour_levels(h)
+        if not len(levels):
+            return
+        bands = np.searchsorted(levels, h, side="right")
+        edges = np.zeros(h.shape, dtype=bool)
+        edges[:, 1:] |= bands[:, 1:] != bands[:, :-1]
+        edges[1:, :] |= bands[1:, :] != bands[:-1, :]
+
+        grad_y, grad_x = np.gradient(h)
+        rows, cols = np.indices(h.shape)
+        along_y = np.abs(grad_x) > np.abs(grad_y)  # Height changes across x, so line runs in y
+        dots = edges & (np.where(along_y, rows, cols) % CONTOUR_DOT_SPACING == 0)
+
+        mask = np.zeros(h.shape, dtype=bool)
+        for dy in range(CONTOUR_DOT_SIZE):
+            for dx in range(CONTOUR_DOT_SIZE):
+                mask[dy:, dx:] |= dots[:h.shape[0]-dy, :h.shape[1]-dx]
+
+        mask_img = Image.fromarray(mask.astype(np.uint8) * 255)
+        self.background.paste("DimGray", (int(left), int(top)), mask_img)
+
+    def calc_height_grid(self, files: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """Vectorised Landscape.get_height, for every combination of position (row) and file"""
+        points = np.array([(x, y, h) for (x, y), h in self.landscape.height_map.items()])
+        h = np.zeros((len(positions), len(files)))
+        if len(points) <= 1:
+            return h + (points[0, 2] if len(points) else 0)
+
+        num_nearest = min(len(points), Landscape.MAX_HEIGHT_INTERPOL)
+        for start in range(0, len(positions), CONTOUR_ROWS_PER_CHUNK):
+            pos = positions[start:start+CONTOUR_ROWS_PER_CHUNK, None, None]
+            sep_sq = ((files[None, :, None] - points[:, 0])*FILE_WIDTH)**2 + (pos - points[:, 1])**2
+            if num_nearest < len(points):
+                nearest = np.argpartition(sep_sq, num_nearest-1, axis=-1)[..., :num_nearest]
+                sep_sq = np.take_along_axis(sep_sq, nearest, axis=-1)
+                heights = points[:, 2][nearest]
+            else:
+                heights = points[:, 2]
+            weights = 1 / np.maximum(sep_sq, 1e-12)  # Exactly on a point is effectively its height
+            h[start:start+CONTOUR_ROWS_PER_CHUNK] = (weights*heights).sum(-1) / weights.sum(-1)
+        return h
+
+    def plot_contour_graph(self) -> BytesIO:
+        import matplotlib.pyplot as plt  # Loads slowly, and its parent package can't be lazy
+
+        X, Y, h = self.make_vectors_for_contour_graph()
+        levels = self.get_contour_levels(h)
 
         fig, ax = plt.subplots(frameon=False)
         ax.set_axis_off()
@@ -141,69 +376,175 @@ class Scene:
         for (file, pos), height in self.landscape.height_map.items():
             if self.min_pos <= pos <= self.max_pos:
                 x, y = self.get_coords(file, pos)
-                draw.text((x, y), f"{height}", fill="Black", font_size=self.font_size, anchor="mm")
+                self.draw_text(draw, (x, y), f"{height}", "Black", self.font_size, "mm")
 
     # FRAME
+    @property
+    def frame_count(self) -> int: return len(self.frames) + len(self.frame_arrays)
+
+    def get_frames(self) -> list[Image.Image]:
+        if self.backend == "numpy":  # Kept as RGBA, since Pillow quantizes RGB much more slowly
+            return [Image.fromarray(array) for array in self.frame_arrays]
+        return self.frames
+
+    def get_frame(self, index: int) -> Image.Image:
+        if self.backend == "numpy":
+            return Image.fromarray(self.frame_arrays[index])
+        return self.frames[index]
+
+    def get_frames_array(self) -> np.ndarray:
+        """All frames drawn so far as a single (frame, y, x, RGB) array of uint8"""
+        if self.backend == "numpy":
+            return np.stack(self.frame_arrays)[..., :3]
+        return np.stack([np.asarray(frame.convert("RGB")) for frame in self.frames])
+
     def init_draw_frame(self) -> None:
-        self.canvas = Image.new(mode="RGBA", size=self.croped_res, color="White")
-        self.canvas.paste(self.background, (0, 0))
+        if self.backend == "numpy":
+            if self.background_array is None:
+                self.background_array = np.array(self.background.convert("RGBA"))
+                self.background_array[..., 3] = 255  # Canvas is opaque, only RGB is blended
+            self.canvas_array = self.background_array.copy()
+        elif self.palette:
+            self.canvas = self.background.copy()
+        else:
+            self.canvas = Image.new(mode="RGBA", size=self.croped_res, color="White")
+            self.canvas.paste(self.background, (0, 0))
 
     def fini_draw_frame(self) -> None:
         if FRAME_COUNTER:
-            ImageDraw.Draw(self.canvas).text((5, 5), f" {len(self.frames)}",
-                                             font_size=self.font_size+8, fill="Black", anchor="lt")
-        self.frames.append(self.canvas)
+            self.draw_counter((5, 5), self.frame_count, self.font_size+8)
+        if self.backend == "numpy":
+            self.frame_arrays.append(self.canvas_array)
+        else:
+            self.frames.append(self.canvas)
 
-    def draw_unit_image(self, unit: Unit, color: str, pow_mod: float, morale: float,
+    def paste(self, image: Image.Image, xy: tuple[int, int]) -> None:
+        """Alpha blends an RGBA image onto the canvas, whichever backend holds it"""
+        if self.backend == "numpy":
+            self.blend_onto_canvas_array(self.to_blend_arrays(image), xy)
+        else:
+            self.canvas.paste(image, xy, image)
+
+    def to_blend_arrays(self, image: Image.Image) -> tuple[np.ndarray, np.ndarray]:
+        """Premultiplied color (+0.5 so truncating rounds) and 1-alpha, ready to blend with"""
+        rgba = np.asarray(image, dtype=np.float32)
+        alpha = rgba[..., 3:] / 255
+        return rgba[..., :3]*alpha + 0.5, 1 - alpha
+
+    def blend_onto_canvas_array(self, arrays: tuple[np.ndarray, np.ndarray], xy: tuple[int, int]
+                                ) -> None:
+        premult, inv_alpha = arrays
+        height, width = inv_alpha.shape[:2]
+        max_y, max_x = self.canvas_array.shape[:2]
+        # Clipped to the canvas, as Image.paste would
+        x0, y0 = max(xy[0], 0), max(xy[1], 0)
+        x1, y1 = min(xy[0] + width, max_x), min(xy[1] + height, max_y)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        region = self.canvas_array[y0:y1, x0:x1, :3]
+        inner = slice(y0 - xy[1], y1 - xy[1]), slice(x0 - xy[0], x1 - xy[0])
+        region[...] = premult[inner] + region*inv_alpha[inner]
+
+    def draw_unit(self, unit: UnitSnapshot, color: str, pow_mod: float, morale: float,
+                  file: float | None, position: float, bkgd_color=(255, 255, 255, 64)) -> None:
+        if self.palette:  # Drawn straight onto the canvas, as palettes cannot be alpha blended
+            draw = ImageDraw.Draw(self.canvas)
+            origin = self.get_unit_corner(file, position)
+            if isinstance(bkgd_color, str):  # Only opaque backgrounds can be drawn
+                draw.rectangle((*origin, origin[0] + self.pixels_unit[0],
+                                origin[1] + self.pixels_unit[1]), fill=bkgd_color)
+            self.draw_unit_on(draw, origin, unit, color, pow_mod, morale)
+        else:
+            sprite = self.get_unit_sprite(unit, color, pow_mod, morale, bkgd_color)
+            corner = self.get_unit_corner(file, position)
+            if isinstance(sprite, tuple):  # Blend arrays of the numpy backend
+                self.blend_onto_canvas_array(sprite, corner)
+            else:
+                self.canvas.paste(sprite, corner, sprite)
+
+    def get_unit_sprite(self, unit: UnitSnapshot, color: str, pow_mod: float, morale: float,
+                        bkgd_color=(255, 255, 255, 64)
+                        ) -> Image.Image | tuple[np.ndarray, np.ndarray]:
+        """Units look the same for many frames in a row, so each look is only drawn once"""
+        key = (unit.name, unit.stance, color, bkgd_color,
+               *self.get_unit_strings(unit, pow_mod, morale))
+        if key not in self.unit_sprites:
+            if len(self.unit_sprites) >= MAX_UNIT_SPRITES:
+                self.unit_sprites.clear()
+            image = self.draw_unit_image(unit, color, pow_mod, morale, bkgd_color)
+            self.unit_sprites[key] = self.to_blend_arrays(image) if self.backend == "numpy" \
+                else image
+        return self.unit_sprites[key]
+
+    def draw_unit_image(self, unit: UnitSnapshot, color: str, pow_mod: float, morale: float,
                         bkgd_color=(255, 255, 255, 64)) -> Image.Image:
         x, y = self.pixels_unit
         image = Image.new(mode="RGBA", size=(x+1, y+1), color=bkgd_color)
-        draw = ImageDraw.Draw(image)
-
-        draw.rectangle((0, 0, x, y), outline=color, width=BORDER_WIDTH)
-        
-        self.draw_unit_text(draw, x, y, unit, color, pow_mod, morale)
-        self.draw_stance_poligon(draw, unit, color)
+        self.draw_unit_on(ImageDraw.Draw(image), (0, 0), unit, color, pow_mod, morale)
         return image
 
-    def draw_unit_text(self, draw: ImageDraw.ImageDraw, x: float, y: float, unit: Unit, color: str,
-                       pow_mod: float, morale: float) -> None:
+    def draw_unit_on(self, draw: ImageDraw.ImageDraw, origin: tuple[int, int], unit: UnitSnapshot,
+                     color: str, pow_mod: float, morale: float) -> None:
+        x, y = self.pixels_unit
+        left, top = origin
+        draw.rectangle((left, top, left+x, top+y), outline=color, width=BORDER_WIDTH)
+
+        self.draw_unit_text(draw, origin, unit, color, pow_mod, morale)
+        self.draw_stance_poligon(draw, origin, unit, color)
+
+    def draw_unit_text(self, draw: ImageDraw.ImageDraw, origin: tuple[int, int], unit: UnitSnapshot,
+                       color: str, pow_mod: float, morale: float) -> None:
+        x, y = self.pixels_unit
+        left, top = origin
         small = self.font_size - int(0.15*self.font_size)
-        name = f"{unit.name} {100*morale:.0f}%"
-        str_m = f"{unit.power + pow_mod:.0f} M"
-        str_r = f"{unit.pow_range + pow_mod:.0f} R" if (unit.ranged or unit.mixed) else ""
+        name, str_m, str_r = self.get_unit_strings(unit, pow_mod, morale)
 
         if self.drawn_file_width < 6.5:  # Power in a column fits better when squarish
-            draw.text((x//2, y//2), name+" "*6, fill=color, font_size=self.font_size, anchor="mm")
-            draw.text((x-3, 4), str_m, fill=color, font_size=small, anchor="rt")
-            if str_r:
-                draw.text((x-4, y-4), str_r, fill=color, font_size=small, anchor="rb")
+            self.draw_text(draw, (left + x//2, top + y//2), name+" "*6, color, self.font_size,
+                           "mm")
+            self.draw_text(draw, (left + x-3, top + 4), str_m, color, small, "rt")
+            self.draw_text(draw, (left + x-4, top + y-4), str_r, color, small, "rb")
 
         else:  # Everything in one line fits better when long and skinny
-            draw.text((x//3, y//2), name, fill=color, font_size=self.font_size, anchor="mm")
-            draw.text((x-4, y//2), str_m+" "+str_r, fill=color, font_size=small, anchor="rm")
+            self.draw_text(draw, (left + x//3, top + y//2), name, color, self.font_size, "mm")
+            self.draw_text(draw, (left + x-4, top + y//2), str_m+" "+str_r, color, small, "rm")
 
-    def draw_stance_poligon(self, draw: ImageDraw.ImageDraw, unit: Unit, color: str) -> None:
+    def get_unit_strings(self, unit: UnitSnapshot, pow_mod: float, morale: float
+                         ) -> tuple[str, str, str]:
+        name = f"{unit.name} {100*morale:.0f}%"
+        str_m = f"{unit.power + pow_mod:.0f} M"
+        str_r = f"{unit.pow_range + pow_mod:.0f} R" if (unit.ranged or unit.mixed) else ""
+        return name, str_m, str_r
+
+    def draw_stance_poligon(self, draw: ImageDraw.ImageDraw, origin: tuple[int, int],
+                            unit: UnitSnapshot, color: str) -> None:
         r = self.pixel_per_pos * STANCE_ICON_FRAC
+        left, top = origin
         if unit.stance is Stance.AGG:
-            draw.regular_polygon((3+r, 3+r, r), 3, rotation=60, fill=color, width=0)
+            draw.regular_polygon((left+3+r, top+3+r, r), 3, rotation=60, fill=color, width=0)
         elif unit.stance is Stance.BAL:
-            draw.regular_polygon((3+r, 3+r, r), 4, fill=color, width=0)
+            draw.regular_polygon((left+3+r, top+3+r, r), 4, fill=color, width=0)
         elif unit.stance is Stance.DEF:
-            draw.regular_polygon((4+r, 4+r, r), 6, fill=color, width=0)
+            draw.regular_polygon((left+4+r, top+4+r, r), 6, fill=color, width=0)
 
-    def paste_unit_image(self, image: Image.Image, file: float | None, position: float) -> None:
+    def get_unit_corner(self, file: float | None, position: float) -> tuple[int, int]:
         file = (self.min_file + self.max_file) / 2 if file is None else file
         centre_x, centre_y = self.get_coords(file, position)
-        coord = int(centre_x - self.pixels_unit[0]/2), int(centre_y - self.pixels_unit[1]/2)
-        self.canvas.paste(image, coord, image)
+        return int(centre_x - self.pixels_unit[0]/2), int(centre_y - self.pixels_unit[1]/2)
+
+    def paste_unit_image(self, image: Image.Image, file: float | None, position: float) -> None:
+        self.paste(image, self.get_unit_corner(file, position))
 
-    def draw_fight(self, unit_A: Unit, unit_B: Unit, color: str | tuple[int, ...], both: bool
-                   ) -> None:
+    def draw_fight(self, unit_A: UnitSnapshot, unit_B: UnitSnapshot, color: str | tuple[int, ...],
+                   both: bool) -> None:
         pos_A = list(self.get_coords(unit_A.file, unit_A.position))
         pos_B = list(self.get_coords(unit_B.file, unit_B.position))
         self.adjust_line_end_points(pos_A, pos_B)
-        self.draw_aa_arrow(pos_A, pos_B, color, both)
+        if self.palette:
+            self.draw_palette_arrow(pos_A, pos_B, color, both)
+        else:
+            self.draw_aa_arrow(pos_A, pos_B, color, both)
 
     def adjust_line_end_points(self, pos_A: list[float], pos_B: list[float]) -> None:
         close = abs(pos_A[1] - pos_B[1]) <= 0.75 * self.pixel_per_pos
@@ -254,101 +595,207 @@ class Scene:
         rotated = image.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True)
         left = min(start[0], end[0])
         top = min(start[1], end[1])
-        self.canvas.paste(rotated, (int(left), int(top)), rotated)
+        self.paste(rotated, (int(left), int(top)))
+
+    def draw_palette_arrow(self, start: list[float], end: list[float],
+                           color: str | tuple[int, ...], both: bool = False) -> None:
+        """Palette colors cannot be anti-aliased, so the arrow is drawn directly onto the canvas"""
+        vec = end[0] - start[0], end[1] - start[1]
+        length = sqrt(vec[0]**2 + vec[1]**2)
+        if length == 0:
+            return
+        half_arrow = min(HALF_ARROWHEAD_SIZE, int(length/4))  # Prevents overlap
+        along = vec[0] / length, vec[1] / length
+        across = -along[1] * half_arrow, along[0] * half_arrow
+
+        def arrowhead(tip: list[float], sign: int) -> list[tuple[float, float]]:
+            base = tip[0] - sign*2*half_arrow*along[0], tip[1] - sign*2*half_arrow*along[1]
+            return [(tip[0], tip[1]),
+                    (base[0] + across[0], base[1] + across[1]),
+                    (base[0] - across[0], base[1] - across[1])]
+
+        draw = ImageDraw.Draw(self.canvas)
+        draw.polygon(arrowhead(end, 1), fill=color)
+        line_start = start[0], start[1]
+        if both:
+            draw.polygon(arrowhead(start, -1), fill=color)
+            line_start = start[0] + half_arrow*along[0], start[1] + half_arrow*along[1]
+        line_end = end[0] - half_arrow*along[0], end[1] - half_arrow*along[1]
+        draw.line([line_start, line_end], fill=color, width=ARROW_WIDTH)
 
 
 @define
 class GraphicBattle(Battle):
-    """Same as parent, but draws a frame every turn and then saves them as a gif
+    """Same as parent, but draws a frame every frame_time of simulated time (and on key events:
+        units removed, reserves deployed, first contact) and then saves them as an animation.
+        Previews are drawn quicker and rougher, then render_full draws them again properly
         GOOD PRACTICE TO CALL GARBAGE COLLECTOR - gc.collect(2) -
         AFTER CLASS IS DONE TO FREE UP MEMORY BALER"""
     max_pixels_x: int
     gif_name: str
+    palette_mode: bool = False  # Draw onto a single shared palette, quicker to save as a gif
+    delta_frames: bool = False  # Save only what changed between frames, smaller and quicker
+    # Simulated time between frames, so the cost of drawing does not depend on DELTA_T
+    frame_time: float = field(default=DELTA_T, validator=validators.ge(DELTA_T))
+    # Reuse backgrounds drawn in previous battles, e.g. DiskCache(CACHE_DIR+"/bg", suffix=".png")
+    background_cache: DiskCache | None = None
+    backend: str = "pillow"  # "numpy" blends frames as arrays, see do_to_array
+    # "matplotlib" draws contour lines with its contour plot, and needs it installed
+    contour_method: str = field(default="numpy", validator=validators.in_(("numpy", "matplotlib")))
+    # "gif", "webp", "webp_lossy", "apng" or "sprites", see Animation.save
+    image_format: str = field(default="gif", validator=validators.in_(FORMAT_EXTENSIONS))
+    preview: bool = False  # Draw at PREVIEW_SCALE, without contours, and fewer frames
+    # Files and positions the scene shows, fixed by where the armies start out
+    bounds: tuple[int, int, float, float] = field(init=False)
     scene: Scene = field(init=False)
+    last_drawn_turn: int = field(init=False, default=0)
+    key_counts: tuple[int, int] = field(init=False)
+    made_contact: bool = field(init=False, default=False)
+    # State at every frame due, even those a preview skips, so they can all be drawn again
+    snapshots: list[TurnSnapshot] = field(init=False, default=Factory(list), repr=False)
+
+    @key_counts.default
+    def _default_key_counts(self) -> tuple[int, int]: return self.count_removed_and_reserves()
 
     def __attrs_post_init__(self) -> None:
         super().__attrs_post_init__()
-        self.set_up_scene()
-
-    def set_up_scene(self) -> None:
         min_file = min(min(self.army_1.file_units), min(self.army_2.file_units))
         max_file = max(max(self.army_1.file_units), max(self.army_2.file_units))
         # Allowing space for physical size of starting units
         min_pos = min(x.init_pos for x in self.army_1.file_units.values()) - 0.5
         max_pos = max(x.init_pos for x in self.army_2.file_units.values()) + 0.5
-        self.scene = Scene(self.max_pixels_x, self.landscape, min_file, max_file, min_pos, max_pos)
+        self.bounds = min_file, max_file, min_pos, max_pos
+        self.scene = self.make_scene(self.preview)
+
+    def make_scene(self, preview: bool) -> Scene:
+        max_pixels_x = int(self.max_pixels_x * PREVIEW_SCALE) if preview else self.max_pixels_x
+        return Scene(max_pixels_x, self.landscape, *self.bounds,
+                     (self.army_1.color, self.army_2.color), "P" if self.palette_mode else "RGBA",
+                     contour_method=self.contour_method, background_cache=self.background_cache,
+                     backend=self.backend, detailed=not preview)
 
     def do_turn(self, verbosity: int) -> None:
         super().do_turn(verbosity)
-        self.draw_frame()
-
-    def draw_frame(self) -> None:
-        self.scene.init_draw_frame()
-
-        for army in (self.army_1, self.army_2):
-            self.draw_deployed_units(army)
-            self.draw_removed_units(army)
-            self.draw_reserve_units(army)
-
-        for unit_A, unit_B in self.fight_pairs.two_way_pairs:
-            color = self.scene.blend_colors(self.army_1.color, self.army_2.color)
-            self.scene.draw_fight(unit_A, unit_B, color, True)
-
-        for unit_A, unit_B in self.fight_pairs.one_way_pairs:
-            color_name = self.get_army_deployed_in(unit_A).color
-            self.scene.draw_fight(unit_A, unit_B, color_name, False)
-
-        self.scene.fini_draw_frame()
-
-    def draw_deployed_units(self, army: Army) -> None:
-        for unit in army.deployed_units:
-            power_mods = self.get_power_mods(unit)
-            morale = self.get_eff_morale(unit)
-            image = self.scene.draw_unit_image(unit, army.color, power_mods, morale)
-            self.scene.paste_unit_image(image, unit.file, unit.position)
-
-    def draw_removed_units(self, army: Army) -> None:
+        if self.is_frame_due():
+            self.draw_frame()
+
+    def is_frame_due(self) -> bool:
+        key_event = self.is_key_event()  # Always called, as it also keeps track of past events
+        elapsed = (self.turns - self.last_drawn_turn) * DELTA_T
+        return key_event or elapsed > self.frame_time - DELTA_T/2
+
+    def is_key_event(self) -> bool:
+        """Whether units were removed, reserves deployed, or armies came into contact this turn"""
+        counts = self.count_removed_and_reserves()
+        in_contact = bool(self.fight_pairs.two_way_pairs or self.fight_pairs.one_way_pairs)
+
+        key_event = counts != self.key_counts or (in_contact and not self.made_contact)
+        self.key_counts = counts
+        self.made_contact |= in_contact
+        return key_event
+
+    def count_removed_and_reserves(self) -> tuple[int, int]:
+        armies = (self.army_1, self.army_2)
+        return sum(len(x.removed) for x in armies), sum(len(x.reserves) for x in armies)
+
+    def draw_frame(self, skippable: bool = True) -> None:
+        """Every frame due is recorded, but previews only draw one in every PREVIEW_FRAME_STEP"""
+        self.run_phase("draw_frame", self._draw_frame, skippable)
+
+    def _draw_frame(self, skippable: bool) -> None:
+        self.last_drawn_turn = self.turns
+        self.snapshots.append(self.snapshot())
+        if not (skippable and self.preview and (len(self.snapshots)-1) % PREVIEW_FRAME_STEP):
+            self.draw_snapshot(self.scene, self.snapshots[-1])
+
+    def draw_snapshot(self, scene: Scene, snapshot: TurnSnapshot) -> None:
+        colors = self.army_1.color, self.army_2.color
+        scene.init_draw_frame()
+
+        for army, color in zip(snapshot.armies, colors):
+            self.draw_deployed_units(scene, army, color)
+            self.draw_removed_units(scene, army)
+            self.draw_reserve_units(scene, army, color)
+
+        deployed = snapshot.get_deployed_by_id()
+        blend = scene.blend_colors(*colors)
+        for id_A, id_B in snapshot.two_way_pairs:
+            scene.draw_fight(deployed[id_A], deployed[id_B], blend, True)
+
+        for id_A, id_B in snapshot.one_way_pairs:
+            unit_A = deployed[id_A]
+            scene.draw_fight(unit_A, deployed[id_B], colors[unit_A.army - 1], False)
+
+        scene.fini_draw_frame()
+
+    def draw_deployed_units(self, scene: Scene, army: ArmySnapshot, color: str) -> None:
+        for unit in army.deployed:
+            assert unit.power_mods is not None and unit.eff_morale is not None, "Not detailed"
+            scene.draw_unit(unit, color, unit.power_mods, unit.eff_morale, unit.file, unit.position)
+
+    def draw_removed_units(self, scene: Scene, army: ArmySnapshot) -> None:
         # Prevents multiple removed units being drawn on top of each other
         present: set[int] = set()
         for unit in reversed(army.removed):
             if unit.file not in present:
                 present.add(unit.file)
-                image = self.scene.draw_unit_image(unit, "Gray", 0, unit.morale)
                 position = unit.init_pos + (2 if unit.init_pos > 0 else -1.95)
-                self.scene.paste_unit_image(image, unit.file, position)
+                scene.draw_unit(unit, "Gray", 0, unit.morale, unit.file, position)
 
-    def draw_reserve_units(self, army: Army) -> None:
+    def draw_reserve_units(self, scene: Scene, army: ArmySnapshot, color: str) -> None:
         for slot, unit in enumerate(reversed(army.reserves)):
-            image = self.scene.draw_unit_image(unit, army.color, 0, unit.morale, bkgd_color="White")
             position = unit.init_pos
             position += (1.0 + slot/5) if position > 0 else -(1.0 + slot/5)
-            self.scene.paste_unit_image(image, None, position)
+            scene.draw_unit(unit, color, 0, unit.morale, None, position, "White")
 
     def do(self, verbosity: int) -> BattleOutcome:
-        self.draw_frame()
-        winner = super().do(verbosity)
-        frames = self.make_padding_frames()
-
-        # loop=0 makes gif loop better on some platforms, even if not needed for others
-        frames[0].save(self.gif_name+".gif", save_all=True, append_images=frames[1:],
-                       duration=FRAME_MS, loop=0)
+        animation = self.do_to_animation(verbosity)
+        file_name = self.gif_name + FORMAT_EXTENSIONS[self.image_format]
+        animation.save(file_name, self.image_format, delta=self.delta_frames)
         if verbosity > 0:
-            print(f"Animation saved to {self.gif_name}")
-        return winner
+            print(f"Animation saved to {file_name}")
+        return self.decide_winner()
 
     def do_to_buffer(self) -> BytesIO:
         # Version of above useful for integrating into pyscript and displaying in browser
-        self.draw_frame()
-        super().do(0)
-        frames = self.make_padding_frames()
-
         stream = BytesIO()
-        # loop=0 makes gif loop better on some platforms, even if not needed for others
-        frames[0].save(stream, format="GIF", save_all=True, append_images=frames[1:],
-                       duration=FRAME_MS, loop=0)
+        self.do_to_animation().save(stream, self.image_format, delta=self.delta_frames)
         return stream
 
+    def do_to_animation(self, verbosity: int = 0) -> Animation:
+        """Every frame drawn, padded at either end, ready to be saved in any format"""
+        self.draw_frame()
+        super().do(verbosity)
+        step = PREVIEW_FRAME_STEP if self.preview else 1
+        return Animation.from_frames(self.make_padding_frames(), FRAME_MS * step,
+                                     self.scene.counter_box)
+
+    def do_to_array(self, verbosity: int = 0) -> np.ndarray:
+        """Raw pixels of every frame drawn, as a (frame, y, x, RGB) array, without any padding"""
+        self.draw_frame()
+        super().do(verbosity)
+        if self.last_drawn_turn != self.turns:
+            self.draw_frame(skippable=False)
+        return self.scene.get_frames_array()
+
+    def render_full(self) -> Animation:
+        """Full quality animation of a battle already fought (usually as a preview), drawn again
+        from its snapshots without running the simulation again"""
+        if not self.snapshots:
+            raise ValueError("Battle must be fought before it can be rendered")
+        scene = self.make_scene(preview=False)
+        for snapshot in self.snapshots:
+            self.draw_snapshot(scene, snapshot)
+        return Animation.from_frames(self.pad_frames(scene.get_frames(), 1), FRAME_MS,
+                                     scene.counter_box)
+
     def make_padding_frames(self) -> list[Image.Image]:
+        if self.last_drawn_turn != self.turns:  # Final turn must always be shown
+            self.draw_frame(skippable=False)
         self.fight_pairs.reset()
-        self.draw_frame()
-        return [self.scene.frames[0]]*30 + self.scene.frames + [self.scene.frames[-1]]*60
+        self.draw_frame(skippable=False)
+        return self.pad_frames(self.scene.get_frames(), PREVIEW_FRAME_STEP if self.preview else 1)
+
+    def pad_frames(self, frames: list[Image.Image], step: int) -> list[Image.Image]:
+        """Holds the first frame for 30 frames and the last for 60, fewer if frames are skipped"""
+        return [frames[0]]*(30 // step) + frames + [frames[-1]]*(60 // step)
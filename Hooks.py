@@ -0,0 +1,124 @@
+"""Instrumentation of battles: callbacks and context managers run around each phase of a turn,
+and collectors of timings and landscape queries built on them"""
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+from typing import Any, Callable, ContextManager, Iterator, Self
+
+from attrs import define, Factory, field
+
+from Geography import query_counters
+
+# Every phase hooks can be added to, "turn" being the whole of each one. Drawing only happens
+# in GraphicBattle, where it is part of the turn
+PHASES = ("turn", "tidy", "fight", "assign_all", "move", "draw_frame")
+HISTOGRAM_BINS = 25  # Bin i holds times under 2**i us, the last one any time longer
+
+# Called as callback(phase, start, seconds, battle) once the phase is done, start by perf_counter
+Callback = Callable[[str, float, float, Any], None]
+# Called as context(phase, battle), and entered for the duration of the phase
+Context = Callable[[str, Any], ContextManager]
+
+
+@define
+class Hooks:
+    """Registry of what to run around each phase. Battles without any (the default) run their
+    phases directly, and those with some only time the phases which have any"""
+    callbacks: dict[str, list[Callback]] = field(
+        init=False, default=Factory(lambda: {phase: [] for phase in PHASES}))
+    contexts: dict[str, list[Context]] = field(
+        init=False, default=Factory(lambda: {phase: [] for phase in PHASES}))
+
+    def add(self, callback: Callback, phases: tuple[str, ...] = PHASES) -> Self:
+        for phase in phases:
+            self.callbacks[phase].append(callback)
+        return self
+
+    def add_context(self, context: Context, phases: tuple[str, ...] = PHASES) -> Self:
+        for phase in phases:
+            self.contexts[phase].append(context)
+        return self
+
+    def run(self, phase: str, battle: Any, func: Callable, *args) -> None:
+        callbacks, contexts = self.callbacks[phase], self.contexts[phase]
+        if not callbacks and not contexts:
+            func(*args)
+            return
+
+        if contexts:
+            with ExitStack() as stack:
+                for context in contexts:
+                    stack.enter_context(context(phase, battle))
+                start = perf_counter()
+                func(*args)
+                seconds = perf_counter() - start
+        else:  # Saves setting up an ExitStack, the bulk of the overhead
+            start = perf_counter()
+            func(*args)
+            seconds = perf_counter() - start
+        for callback in callbacks:
+            callback(phase, start, seconds, battle)
+
+
+""" COLLECTORS """
+
+
+@define
+class PhaseHistogram:
+    """Wall clock time of every call of each phase, as a callback for Hooks.add. Times are
+    binned by powers of 2 of microseconds, so memory does not grow with the number of turns"""
+    bins: dict[str, list[int]] = field(init=False, default=Factory(dict))
+    seconds: dict[str, float] = field(init=False, default=Factory(dict))  # Total of each phase
+
+    def __call__(self, phase: str, start: float, seconds: float, battle: Any) -> None:
+        if phase not in self.bins:
+            self.bins[phase] = [0] * HISTOGRAM_BINS
+            self.seconds[phase] = 0
+        self.bins[phase][min(int(seconds * 1e6).bit_length(), HISTOGRAM_BINS - 1)] += 1
+        self.seconds[phase] += seconds
+
+    def get_calls(self, phase: str) -> int:
+        return sum(self.bins[phase])
+
+    def get_percentile(self, phase: str, fraction: float) -> float:
+        """Upper bound in seconds of the bin that fraction of the calls fall under"""
+        target = fraction * self.get_calls(phase)
+        total = 0
+        for index, count in enumerate(self.bins[phase]):
+            total += count
+            if total >= target:
+                break
+        return 2**index / 1e6
+
+    def report(self) -> str:
+        lines = [f"{'Phase':<12} {'Calls':>7} {'Total ms':>9} {'Mean us':>8} "
+                 f"{'p50 us <':>9} {'p90 us <':>9} {'p99 us <':>9}"]
+        for phase, seconds in self.seconds.items():
+            calls = self.get_calls(phase)
+            lines.append(f"{phase:<12} {calls:>7} {1000*seconds:>9.1f} {1e6*seconds/calls:>8.1f}"
+                         + "".join(f" {1e6*self.get_percentile(phase, x):>9.0f}"
+                                   for x in (0.5, 0.9, 0.99)))
+        return "\n".join(lines)
+
+
+@define
+class QueryCounter:
+    """Calls to the landscape queries (get_height and accumulate_over_terrain) made during each
+    phase, as a context for Hooks.add_context. A query made in a phase nested in another, such
+    as assign_all in fight, counts for both"""
+    counts: dict[str, Counter[str]] = field(init=False, default=Factory(dict))
+
+    @contextmanager
+    def __call__(self, phase: str, battle: Any) -> Iterator[None]:
+        query_counters.append(self.counts.setdefault(phase, Counter()))
+        try:
+            yield
+        finally:
+            query_counters.pop()
+
+    def report(self) -> str:
+        queries = sorted({query for counter in self.counts.values() for query in counter})
+        lines = [f"{'Phase':<12}" + "".join(f" {query:>22}" for query in queries)]
+        for phase, counter in self.counts.items():
+            lines.append(f"{phase:<12}" + "".join(f" {counter[query]:>22}" for query in queries))
+        return "\n".join(lines)
@@ -0,0 +1,26 @@
+"""Deferred imports, so the heavy graphics stack is only loaded once something is drawn"""
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Returns the module straight away, but only executes it when an attribute is first used.
+    Parent packages are imported as normal, so keep them light (e.g. PIL, not matplotlib)"""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    parent, _, child = name.rpartition(".")
+    if parent:  # As a normal import would, so "import PIL.Image" elsewhere finds it too
+        setattr(sys.modules[parent], child, module)
+    return module
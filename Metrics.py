@@ -0,0 +1,80 @@
+"""Time series of battle-wide metrics, one row per turn, for analysing many battles without the
+cost of snapshots"""
+import csv
+from array import array
+from math import nan
+from typing import Any, TextIO
+
+from attrs import define, field
+
+# Morale is the sum of the raw morale of deployed units. Front is the midpoint of the mean
+# positions of each army's deployed units, so moves towards army 2 as army 1 pushes forward. If
+# only one army has units deployed it is their mean position, and NaN if neither has any
+COLUMNS = ("turn", "morale_1", "morale_2", "two_way", "one_way", "halted", "reserves_1",
+           "reserves_2", "front")
+ARMY_COLUMNS = (("morale_1", "reserves_1"), ("morale_2", "reserves_2"))
+CAPACITY = 1024  # Battles end after 1001 turns, so every turn fits by default
+
+
+@define
+class MetricsRecorder:
+    """Metrics of every turn, as a callback for Hooks.add on the "turn" phase. Buffers are
+    allocated once, and only hold the last capacity turns if there are more"""
+    capacity: int = CAPACITY
+    buffers: dict[str, array] = field(init=False)
+    count: int = field(init=False, default=0)  # Turns recorded, including overwritten ones
+
+    @buffers.default
+    def _default_buffers(self) -> dict[str, array]:
+        return {column: array("d", bytes(8 * self.capacity)) for column in COLUMNS}
+
+    def __call__(self, phase: str, start: float, seconds: float, battle: Any) -> None:
+        row = self.count % self.capacity
+        self.count += 1
+        buffers = self.buffers
+        buffers["turn"][row] = battle.turns
+
+        halted = 0
+        front, armies = 0.0, 0  # Sum of the mean position of each army with units in files
+        for army, (morale_column, reserves_column) in zip((battle.army_1, battle.army_2),
+                                                          ARMY_COLUMNS):
+            morale = position = 0.0
+            for unit in army.deployed_units:
+                morale += unit.morale
+                position += unit.position
+                halted += unit.halted
+            buffers[morale_column][row] = morale
+            buffers[reserves_column][row] = len(army.reserves)
+            if army.file_units:
+                front += position / len(army.file_units)
+                armies += 1
+        buffers["front"][row] = front / armies if armies else nan
+        buffers["two_way"][row] = len(battle.fight_pairs.two_way_pairs)
+        buffers["one_way"][row] = len(battle.fight_pairs.one_way_pairs)
+        buffers["halted"][row] = halted
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    """ EXPORT """
+
+    def get_column(self, column: str) -> list[float]:
+        """Values of the column from the oldest turn held to the latest"""
+        buffer = self.buffers[column]
+        if self.count <= self.capacity:
+            return buffer[:self.count].tolist()
+        row = self.count % self.capacity
+        return buffer[row:].tolist() + buffer[:row].tolist()
+
+    def to_dict(self) -> dict[str, list[float]]:
+        return {column: self.get_column(column) for column in COLUMNS}
+
+    def save(self, fp: str | TextIO) -> None:
+        """As CSV, with a header row of the column names"""
+        if isinstance(fp, str):
+            with open(fp, "w", encoding="utf-8", newline="") as stream:
+                self.save(stream)
+            return
+        writer = csv.writer(fp)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*(self.get_column(column) for column in COLUMNS)))
@@ -0,0 +1,253 @@
+"""Outcomes of battles stored by the content of what was fought, as battles are deterministic and
+tournaments or sweeps keep fighting the same ones again"""
+import json
+import sqlite3
+from itertools import chain
+from pathlib import Path
+from typing import Any, Self
+
+from attrs import define, Factory, field
+
+import Globals
+from Battle import Battle
+from Cache import stable_hash
+from Config import CACHE_DIR, DELTA_T
+from Geography import Landscape, Terrain
+from Globals import BattleOutcome
+from Unit import Army, Unit
+
+ENGINE_VERSION = 3  # Bump whenever a change to the rules alters the outcome of some battles
+DECIMALS: int = 4   # Morale in summaries is rounded to this many
+
+
+""" MIRRORS """
+
+
+@define(frozen=True)
+class Mirror:
+    """Reflection of a battle, each is its own inverse. Swapping the armies also reflects the
+    landscape about position 0, so each army still fights over the same ground"""
+    swap: bool = False   # Army 1 becomes army 2 and vice versa
+    files: bool = False  # Reflected about file 0, for both armies and the landscape
+
+    def apply(self, army_1: Army, army_2: Army, landscape: Landscape
+              ) -> tuple[Army, Army, Landscape]:
+        """New armies and landscape, the ones given are left as they are"""
+        army_1, army_2 = mirror_army(army_1, self.files), mirror_army(army_2, self.files)
+        if self.swap:
+            army_1, army_2 = army_2, army_1
+        return army_1, army_2, landscape.mirrored(files=self.files, positions=self.swap)
+
+
+MIRRORS = (Mirror(), Mirror(files=True), Mirror(swap=True), Mirror(swap=True, files=True))
+SWAPPED_OUTCOMES = {BattleOutcome.WIN_1: BattleOutcome.WIN_2,
+                    BattleOutcome.WIN_2: BattleOutcome.WIN_1}
+
+
+def mirror_army(army: Army, files: bool) -> Army:
+    def mirror_unit(unit: Unit) -> Unit:
+        mirrored = Unit(unit.unit_type, unit.stance, -unit.file if files else unit.file)
+        mirrored.morale = unit.morale
+        return mirrored
+
+    mirrored = Army(army.name, army.stance, army.color)
+    mirrored.file_units = {unit.file: unit for unit in map(mirror_unit, army.deployed_units)}
+    mirrored.reserves = [mirror_unit(unit) for unit in army.reserves]
+    return mirrored
+
+
+def find_asymmetries(army_1: Army, army_2: Army, landscape: Landscape) -> list[Mirror]:
+    """Mirrors whose image of the battle does not end as the mirror image of its result, each
+    fought from fresh copies. The identity is fought again too, and is only listed if fighting
+    is not deterministic. Otherwise those listed are real asymmetries of the rules, such as
+    ties broken towards one side"""
+    def fight(mirror: Mirror) -> BattleResult:
+        battle = Battle(*mirror.apply(army_1, army_2, landscape))
+        battle.do(0)
+        return BattleResult.from_battle(battle).mirrored(mirror)
+
+    original = fight(MIRRORS[0])
+    return [mirror for mirror in MIRRORS if fight(mirror) != original]
+
+
+""" RESULTS """
+
+
+@define(frozen=True)
+class ArmySummary:
+    """What is left of an army once the battle is over, deployed units as (file, name, morale)"""
+    deployed: tuple[tuple[int, str, float], ...]
+    reserves: tuple[str, ...]
+    removed: int
+
+    @classmethod
+    def from_army(cls, army: Army) -> Self:
+        deployed = tuple((file, unit.name, round(unit.morale, DECIMALS))
+                         for file, unit in sorted(army.file_units.items()))
+        return cls(deployed, tuple(unit.name for unit in army.reserves), len(army.removed))
+
+    @property
+    def survivors(self) -> int: return len(self.deployed) + len(self.reserves)
+    @property
+    def mean_morale(self) -> float:
+        return sum(x[2] for x in self.deployed) / len(self.deployed) if self.deployed else 0
+
+    def mirrored(self) -> Self:
+        """Same army reflected about file 0"""
+        deployed = sorted((-file, name, morale) for file, name, morale in self.deployed)
+        return type(self)(tuple(deployed), self.reserves, self.removed)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"deployed": [list(x) for x in self.deployed], "reserves": list(self.reserves),
+                "removed": self.removed}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        return cls(tuple((int(file), str(name), float(morale))
+                         for file, name, morale in data["deployed"]),
+                   tuple(data["reserves"]), int(data["removed"]))
+
+
+@define(frozen=True)
+class BattleResult:
+    """Everything kept of a battle once fought"""
+    outcome: BattleOutcome
+    turns: int
+    army_1: ArmySummary
+    army_2: ArmySummary
+
+    @classmethod
+    def from_battle(cls, battle: Battle) -> Self:
+        return cls(battle.decide_winner(), battle.turns,
+                   ArmySummary.from_army(battle.army_1), ArmySummary.from_army(battle.army_2))
+
+    def mirrored(self, mirror: Mirror) -> Self:
+        """Result the mirror image of the battle would have, were it exactly symmetric"""
+        army_1, army_2 = (self.army_2, self.army_1) if mirror.swap else (self.army_1, self.army_2)
+        if mirror.files:
+            army_1, army_2 = army_1.mirrored(), army_2.mirrored()
+        outcome = SWAPPED_OUTCOMES.get(self.outcome, self.outcome) if mirror.swap else self.outcome
+        return type(self)(outcome, self.turns, army_1, army_2)
+
+
+""" KEYS """
+
+
+def battle_key(army_1: Army, army_2: Army, landscape: Landscape) -> str:
+    """Same for any two battles that must end the same way. Names and colors of the armies and
+    terrains are left out, unit names are kept in as the summaries list them"""
+    return stable_hash([get_engine_constants(), get_army_inputs(army_1),
+                        get_army_inputs(army_2), get_landscape_inputs(landscape)])
+
+
+def get_engine_constants() -> dict[str, float]:
+    """Every constant the rules of the battle depend on, so changing any of them misses the cache"""
+    constants = {name: value for name, value in vars(Globals).items()
+                 if name.isupper() and isinstance(value, (int, float))}
+    return constants | {"ENGINE_VERSION": ENGINE_VERSION, "DELTA_T": DELTA_T,
+                        "POS_DEC_DIG": Unit.POS_DEC_DIG,
+                        "MAX_HEIGHT_INTERPOL": Landscape.MAX_HEIGHT_INTERPOL}
+
+
+def get_army_inputs(army: Army) -> list:
+    if army.removed or any(unit.init_pos for unit in chain(army.deployed_units, army.reserves)):
+        raise ValueError(f"{army.name} has already been set up for a battle")
+    return [army.stance, [[file, get_unit_inputs(unit)] for file, unit
+                          in sorted(army.file_units.items())],
+            [get_unit_inputs(unit) for unit in army.reserves]]
+
+
+def get_unit_inputs(unit: Unit) -> list:
+    return [unit.unit_type, unit.stance, unit.morale]
+
+
+def get_landscape_inputs(landscape: Landscape) -> list:
+    def get_terrain_inputs(terrain: Terrain) -> list:
+        return [terrain.roughness, terrain.cover, terrain.penalty]
+
+    terrain_map = {file: [[bound, get_terrain_inputs(terrain)] for bound, terrain in x.items()]
+                   for file, x in landscape.terrain_map.items()}
+    return [terrain_map, landscape.height_map]
+
+
+""" STORE """
+
+
+@define
+class ResultCache:
+    """Results in a single SQLite file, which processes running in parallel can share.
+    Use as a context manager, or call close() when done"""
+    path: Path = field(converter=Path, default=Path(CACHE_DIR) / "results.sqlite")
+    timeout: float = 30  # Seconds to wait for another process writing at the same time
+    mirrors: bool = False  # Derive results from those of mirror images, see fight()
+    mismatches: list[str] = field(init=False, default=Factory(list))  # Keys, see fight()
+    _connection: sqlite3.Connection = field(init=False, repr=False)
+
+    def __attrs_post_init__(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=self.timeout)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, outcome INTEGER, "
+                "turns INTEGER, army_1 TEXT, army_2 TEXT)")
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def get(self, key: str) -> BattleResult | None:
+        row = self._connection.execute(
+            "SELECT outcome, turns, army_1, army_2 FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        outcome, turns, army_1, army_2 = row
+        return BattleResult(BattleOutcome(outcome), turns,
+                            ArmySummary.from_dict(json.loads(army_1)),
+                            ArmySummary.from_dict(json.loads(army_2)))
+
+    def put(self, key: str, result: BattleResult) -> None:
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, int(result.outcome), result.turns,
+                 json.dumps(result.army_1.to_dict()), json.dumps(result.army_2.to_dict())))
+
+    def find(self, army_1: Army, army_2: Army, landscape: Landscape
+             ) -> tuple[BattleResult, Mirror] | None:
+        """Result of the battle or of a mirror image of it, with the mirror it was found through.
+        Mirrored results are only exact if the battle is symmetric, see fight()"""
+        for mirror in MIRRORS if self.mirrors else MIRRORS[:1]:
+            result = self.get(battle_key(*mirror.apply(army_1, army_2, landscape)))
+            if result is not None:
+                return result.mirrored(mirror), mirror
+        return None
+
+    def fight(self, army_1: Army, army_2: Army, landscape: Landscape, verify: bool = False
+              ) -> BattleResult:
+        """Result of the battle, only fought if neither it nor a mirror image is already stored.
+        The armies are used up by it as with any battle, but left untouched when not fought.
+        The engine breaks ties by side and file, so mirror images can end differently, see
+        find_asymmetries. If verify, those found through a mirror are fought anyway, and the
+        keys of those which did not match are added to mismatches"""
+        key = battle_key(army_1, army_2, landscape)
+        found = self.find(army_1, army_2, landscape)
+        if found is not None:
+            result, mirror = found
+            if not verify or mirror == MIRRORS[0]:
+                return result
+
+        battle = Battle(army_1, army_2, landscape)
+        battle.do(0)
+        fought = BattleResult.from_battle(battle)
+        self.put(key, fought)
+        if found is not None and fought != result:
+            self.mismatches.append(key)
+        return fought
@@ -0,0 +1,100 @@
+"""Plain data description of a battle by the names of its units and landscape, as sent by clients"""
+from typing import Any, Self
+
+from attrs import define
+
+from Data import landscape_dict, unit_dict, units_18C_dict
+from Geography import Landscape
+from Globals import Stance
+from Unit import Army
+
+ALL_UNITS = unit_dict | units_18C_dict
+MAX_FILE: int = 10     # Furthest file from the centre that units can be placed in
+MAX_RESERVES: int = 20
+
+
+@define(frozen=True)
+class ArmySpec:
+    """Units by their name in Data, deployed ones as (file, name) pairs sorted by file"""
+    name: str
+    stance: Stance
+    color: str
+    units: tuple[tuple[int, str], ...]
+    reserves: tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Any, name: str = "", color: str = "Black") -> Self:
+        """Unit files may be given as strings, since json object keys always are. Name and color
+        are only the defaults for when data has none. Data of the wrong shape raises ValueError,
+        with a message fit to pass on to whoever sent it"""
+        if not isinstance(data, dict):
+            raise ValueError(f"{name or 'Army'} must be an object")
+        name = str(data.get("name", name))
+        units, reserves = data.get("units"), data.get("reserves", [])
+        if not isinstance(units, dict) or not all(isinstance(x, str) for x in units.values()):
+            raise ValueError(f"Units of {name} must be an object of unit names by file")
+        if not isinstance(reserves, list) or not all(isinstance(x, str) for x in reserves):
+            raise ValueError(f"Reserves of {name} must be a list of unit names")
+        try:
+            files = [int(file) for file in units]
+        except ValueError:
+            raise ValueError(f"Unit files of {name} must be whole numbers")
+        stance = data.get("stance", "BAL")
+        if not isinstance(stance, str) or stance not in Stance.__members__:
+            raise ValueError(f"Unknown stance {stance}")
+        spec = cls(name, Stance[stance], str(data.get("color", color)),
+                   tuple(sorted(zip(files, units.values()))), tuple(reserves))
+        spec.validate()
+        return spec
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"name": self.name, "stance": self.stance.name, "color": self.color,
+                "units": {str(file): name for file, name in self.units},
+                "reserves": list(self.reserves)}
+
+    def validate(self) -> None:
+        if not self.units:
+            raise ValueError(f"Army {self.name} has no deployed units")
+        if any(abs(file) > MAX_FILE for file, _ in self.units):
+            raise ValueError(f"Army {self.name} has units beyond file {MAX_FILE}")
+        if len(self.reserves) > MAX_RESERVES:
+            raise ValueError(f"Army {self.name} has more than {MAX_RESERVES} reserves")
+        for name in [name for _, name in self.units] + list(self.reserves):
+            if name not in ALL_UNITS:
+                raise ValueError(f"Unknown unit {name}")
+
+    def make_army(self) -> Army:
+        army = Army(self.name, self.stance, self.color)
+        for file, name in self.units:
+            army.add(file, ALL_UNITS[name])
+        army.add_reserves(*(ALL_UNITS[name] for name in self.reserves))
+        return army
+
+
+@define(frozen=True)
+class Scenario:
+    """Everything needed to set up a battle, landscape by its name in Data.landscape_dict"""
+    army_1: ArmySpec
+    army_2: ArmySpec
+    landscape: str
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Self:
+        """Raises ValueError for data of the wrong shape, as ArmySpec.from_dict"""
+        if not isinstance(data, dict):
+            raise ValueError("Scenario must be an object")
+        if not isinstance(data.get("landscape"), str) or data["landscape"] not in landscape_dict:
+            raise ValueError(f"Unknown landscape {data.get('landscape')}")
+        return cls(ArmySpec.from_dict(data.get("army_1"), "Army 1", "DarkBlue"),
+                   ArmySpec.from_dict(data.get("army_2"), "Army 2", "DarkRed"), data["landscape"])
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"army_1": self.army_1.to_dict(), "army_2": self.army_2.to_dict(),
+                "landscape": self.landscape}
+
+    def make_armies(self) -> tuple[Army, Army]:
+        """New armies each time, as battles alter those they are given"""
+        return self.army_1.make_army(), self.army_2.make_army()
+
+    def make_landscape(self) -> Landscape:
+        return landscape_dict[self.landscape]()
@@ -0,0 +1,491 @@
+"""Local battle service. Battles are run in a pool of processes behind a bounded queue, and their
+progress streamed back as it happens, over HTTP as JSON Lines or over a WebSocket as one JSON text
+message per update. Run as "python Server.py [--port 8765] [--workers 3] [--queue 8]"
+
+POST   /battles        {"scenario": {...}, "options": {...}}, see Scenario.from_dict and JobOptions
+GET    /battles        Upgraded to a WebSocket, first message is the same as the body of the POST.
+                       Sending {"type": "cancel"} or closing it cancels the battle
+DELETE /battles/<job>  Cancels a queued or running battle
+GET    /status         Jobs queued and running
+GET    /catalog        Names of the units and landscapes scenarios can use
+
+Every stream starts with {"type": "queued", "job": id}, then "started", then either "turn"
+messages (as Export.snapshot_to_dict) or "frame" ones (base64 PNG), and ends with a "done" message
+holding the outcome and why it stopped, or an "error" one"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from io import BytesIO
+from itertools import count
+from math import isfinite
+from multiprocessing import Manager
+from queue import Empty
+from typing import Any, Awaitable, Callable, Iterator, Self
+
+from attrs import define, Factory, field
+
+from Battle import Battle
+from Config import DELTA_T
+from Data import landscape_dict
+from Export import snapshot_to_dict
+from GraphicBattle import GraphicBattle
+from Scenario import ALL_UNITS, Scenario
+
+MAX_TURNS: int = 1000        # Battles end by themselves after this many turns anyway
+MAX_SECONDS: float = 60      # Wall clock limit of any battle, requests may only ask for less
+MAX_PIXELS_X: int = 1200     # Widest frames that can be asked for
+MAX_BODY_BYTES: int = 2**16  # Largest request body or WebSocket message accepted
+POLL_SECONDS: float = 0.1    # How often waiting on a worker checks it has not died
+CANCEL_SECONDS: float = 0.05  # How often a running battle asks the manager if it is cancelled
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"  # Fixed by RFC 6455
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA  # WebSocket opcodes
+FINAL_MESSAGES = ("done", "error")
+
+
+class HttpError(Exception):
+    """Ends a request with the given status, before anything else has been sent back"""
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+@define(frozen=True)
+class JobOptions:
+    """What to stream back and when to give up, clamped to the limits of the server"""
+    stream: str = "state"  # "state" of deployed units after turns, or "frames" drawn as PNGs
+    every: int = 1  # Only send the state of one in this many turns
+    max_turns: int = MAX_TURNS
+    max_seconds: float = MAX_SECONDS
+    max_pixels_x: int = 600
+    frame_time: float = 0.05  # Simulated time between frames
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Self:
+        """Raises ValueError for data of the wrong shape, as Scenario.from_dict"""
+        if not isinstance(data, dict):
+            raise ValueError("Options must be an object")
+        stream = data.get("stream", "state")
+        if stream not in ("state", "frames"):
+            raise ValueError(f"Unknown stream {stream}")
+        return cls(stream,
+                   max(1, int(get_number(data, "every", 1))),
+                   max(1, min(int(get_number(data, "max_turns", MAX_TURNS)), MAX_TURNS)),
+                   max(0, min(get_number(data, "max_seconds", MAX_SECONDS), MAX_SECONDS)),
+                   max(100, min(int(get_number(data, "max_pixels_x", 600)), MAX_PIXELS_X)),
+                   max(DELTA_T, get_number(data, "frame_time", 0.05)))
+
+
+def get_number(data: dict[str, Any], key: str, default: float) -> float:
+    """JSON numbers only, as Python would also take strings or true, and json.loads lets NaN in"""
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not isfinite(value):
+        raise ValueError(f"{key} must be a number")
+    return value
+
+
+##############
+""" WORKER """
+##############
+
+def run_job(scenario: Scenario, options: JobOptions, out: Any, cancel: Any) -> None:
+    """Runs in a pool process, putting (type, json text) messages on the out queue as the battle
+    goes, the last always "done" or "error". Limits are checked every turn, but cancellation only
+    every CANCEL_SECONDS, as each check is a round trip to the manager process"""
+    try:
+        out.put(("started", json.dumps({"type": "started"})))
+        out.put(("done", json.dumps(fight_job(scenario, options, out, cancel))))
+    except Exception as error:  # Reported to the client, rather than lost in the pool
+        out.put(("error", json.dumps({"type": "error", "message": repr(error)})))
+
+
+def fight_job(scenario: Scenario, options: JobOptions, out: Any, cancel: Any) -> dict:
+    start = time.perf_counter()
+    battle: Battle
+    if options.stream == "frames":
+        battle = GraphicBattle(*scenario.make_armies(), scenario.make_landscape(),
+                               options.max_pixels_x, "", frame_time=options.frame_time)
+        battle.draw_frame()
+    else:
+        battle = Battle(*scenario.make_armies(), scenario.make_landscape())
+
+    sent_frames = 0
+    reason = "finished"
+    next_cancel_check = start + CANCEL_SECONDS
+    for turn in battle.iter_turn_numbers():
+        if isinstance(battle, GraphicBattle):
+            sent_frames = put_new_frames(battle, sent_frames, out)
+        elif turn % options.every == 0:
+            message = {"type": "turn"} | snapshot_to_dict(battle.snapshot(detailed=True))
+            out.put(("turn", json.dumps(message, separators=(",", ":"))))
+
+        if battle.is_battle_ended():
+            break
+        now = time.perf_counter()
+        if now >= next_cancel_check:
+            next_cancel_check = now + CANCEL_SECONDS
+            if cancel.is_set():
+                reason = "cancelled"
+                break
+        if turn >= options.max_turns:
+            reason = "max_turns"
+            break
+        if now - start > options.max_seconds:
+            reason = "max_seconds"
+            break
+
+    if isinstance(battle, GraphicBattle) and battle.last_drawn_turn != battle.turns:
+        battle.draw_frame(skippable=False)  # Stopped between frames, but the end must be shown
+        put_new_frames(battle, sent_frames, out)
+    return {"type": "done", "reason": reason, "outcome": battle.decide_winner().name,
+            "turns": battle.turns, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def put_new_frames(battle: GraphicBattle, sent: int, out: Any) -> int:
+    """Frames are only drawn every so often, so most turns have none to send"""
+    for index in range(sent, battle.scene.frame_count):
+        buffer = BytesIO()
+        battle.scene.get_frame(index).save(buffer, format="PNG", compress_level=1)
+        message = {"type": "frame", "index": index, "turn": battle.last_drawn_turn,
+                   "png": base64.b64encode(buffer.getvalue()).decode("ascii")}
+        out.put(("frame", json.dumps(message)))
+    return battle.scene.frame_count
+
+
+##############
+""" SERVER """
+##############
+
+@define(eq=False)
+class Job:
+    """A battle asked for by one client, messages from its worker are relayed to the client"""
+    id: int
+    scenario: Scenario
+    options: JobOptions
+    out: Any  # Manager queue, filled by the worker process
+    cancel: Any  # Manager event, checked by the worker process
+    messages: asyncio.Queue = field(init=False, default=Factory(asyncio.Queue))
+    cancelled: bool = field(init=False, default=False)  # Saves asking the manager process
+    running: bool = field(init=False, default=False)
+
+
+@define
+class BattleServer:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    workers: int = field(default=Factory(lambda: max(1, (os.cpu_count() or 2) - 1)))
+    max_queued: int = 8  # Further requests are turned away until there is room
+    jobs: dict[int, Job] = field(init=False, default=Factory(dict))
+    _ids: Iterator[int] = field(init=False, default=Factory(lambda: count(1)))
+    _queue: asyncio.Queue = field(init=False, default=None)
+    _manager: Any = field(init=False, default=None)
+    _pool: ProcessPoolExecutor = field(init=False, default=None)
+
+    async def serve(self) -> None:
+        self._queue = asyncio.Queue(self.max_queued)
+        with Manager() as manager, ProcessPoolExecutor(self.workers) as pool:
+            self._manager, self._pool = manager, pool
+            runners = [asyncio.create_task(self.run_jobs()) for _ in range(self.workers)]
+            server = await asyncio.start_server(self.handle, self.host, self.port)
+            print(f"Serving battles on http://{self.host}:{self.port} with {self.workers} workers")
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                for runner in runners:
+                    runner.cancel()
+
+    # JOBS
+    def submit(self, data: Any) -> Job:
+        if not isinstance(data, dict):
+            raise HttpError(400, "Invalid request: body must be an object")
+        try:
+            scenario = Scenario.from_dict(data.get("scenario"))
+            options = JobOptions.from_dict(data.get("options", {}))
+        except ValueError as error:
+            raise HttpError(400, f"Invalid request: {error}")
+
+        job = Job(next(self._ids), scenario, options, self._manager.Queue(),
+                  self._manager.Event())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HttpError(503, "Too many battles queued, try again later")
+        self.jobs[job.id] = job
+        return job
+
+    def cancel(self, job: Job) -> None:
+        if not job.cancelled:
+            job.cancelled = True
+            job.cancel.set()
+
+    async def run_jobs(self) -> None:
+        """One of these per worker process, each taking the next job once its last is done"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancelled:  # Cancelled while still queued
+                    message = {"type": "done", "reason": "cancelled", "outcome": None, "turns": 0}
+                    await job.messages.put(("done", json.dumps(message)))
+                    continue
+                job.running = True
+                future = loop.run_in_executor(self._pool, run_job, job.scenario, job.options,
+                                              job.out, job.cancel)
+                await self.relay(job, future)
+            finally:
+                self.jobs.pop(job.id, None)
+
+    async def relay(self, job: Job, future: asyncio.Future) -> None:
+        """Passes messages from the worker on to the client, until the last one"""
+        while True:
+            try:
+                kind, text = await asyncio.to_thread(job.out.get, True, POLL_SECONDS)
+            except Empty:
+                if future.done():  # Worker process died without a last message
+                    message = {"type": "error", "message": f"Worker failed: {future.exception()!r}"}
+                    await job.messages.put(("error", json.dumps(message)))
+                    return
+                continue
+            await job.messages.put((kind, text))
+            if kind in FINAL_MESSAGES:
+                await future
+                return
+
+    async def stream(self, job: Job, send: Callable[[str], Awaitable[None]]) -> None:
+        """Sends every message of the job until its last, cancelling it if the client goes"""
+        try:
+            await send(json.dumps({"type": "queued", "job": job.id}))
+            while True:
+                kind, text = await job.messages.get()
+                await send(text)
+                if kind in FINAL_MESSAGES:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            self.cancel(job)
+            raise
+
+    # CONNECTIONS
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, path, headers, body = await read_request(reader)
+            if path == "/battles" and headers.get("upgrade", "").lower() == "websocket":
+                await self.handle_websocket(reader, writer, headers)
+            elif method == "POST" and path == "/battles":
+                await self.handle_post(reader, writer, body)
+            elif method == "DELETE" and path.startswith("/battles/"):
+                await self.handle_delete(writer, path.removeprefix("/battles/"))
+            elif method == "GET" and path == "/status":
+                await send_json(writer, 200, self.get_status())
+            elif method == "GET" and path == "/catalog":
+                await send_json(writer, 200, {"units": sorted(ALL_UNITS),
+                                              "landscapes": sorted(landscape_dict)})
+            else:
+                raise HttpError(404, f"Nothing at {method} {path}")
+        except HttpError as error:
+            await send_json(writer, error.status, {"type": "error", "message": str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away, any job it had is already cancelled
+        finally:
+            writer.close()
+
+    def get_status(self) -> dict[str, Any]:
+        return {"workers": self.workers, "max_queued": self.max_queued,
+                "queued": [job.id for job in self.jobs.values() if not job.running],
+                "running": [job.id for job in self.jobs.values() if job.running]}
+
+    async def handle_delete(self, writer: asyncio.StreamWriter, job_id: str) -> None:
+        job = self.jobs.get(int(job_id)) if job_id.isdigit() else None
+        if job is None:
+            raise HttpError(404, "No such battle queued or running")
+        self.cancel(job)
+        await send_json(writer, 200, {"job": job.id, "cancelled": True})
+
+    async def handle_post(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                          body: bytes) -> None:
+        job = self.submit(parse_json(body))
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+
+        async def send(text: str) -> None:
+            data = text.encode() + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+
+        await self.stream_until_gone(job, send, watch_eof(reader))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                               headers: dict[str, str]) -> None:
+        key = headers.get("sec-websocket-key")
+        if key is None:
+            raise HttpError(400, "Missing Sec-WebSocket-Key")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n" % accept.encode())
+        await writer.drain()
+
+        payload = await read_ws_message(reader, writer)
+        if payload is None:  # Closed before asking for anything
+            writer.write(encode_ws_frame(b"", WS_CLOSE))
+            await writer.drain()
+            return
+        try:
+            job = self.submit(parse_json(payload))
+        except HttpError as error:  # Too late for a status, so it is sent as a message instead
+            writer.write(encode_ws_frame(json.dumps({"type": "error", "message": str(error)})))
+            writer.write(encode_ws_frame(b"", WS_CLOSE))
+            await writer.drain()
+            return
+
+        async def send(text: str) -> None:
+            writer.write(encode_ws_frame(text))
+            await writer.drain()
+
+        await self.stream_until_gone(job, send, watch_websocket(reader, writer))
+        writer.write(encode_ws_frame(b"", WS_CLOSE))
+        await writer.drain()
+
+    async def stream_until_gone(self, job: Job, send: Callable[[str], Awaitable[None]],
+                                watch: Awaitable[None]) -> None:
+        """Streams the job, but cancels it as soon as watch returns: the client left or asked"""
+        def on_gone(_) -> None: self.cancel(job)
+
+        watcher = asyncio.ensure_future(watch)
+        watcher.add_done_callback(on_gone)
+        try:
+            await self.stream(job, send)
+        finally:
+            watcher.remove_done_callback(on_gone)
+            watcher.cancel()
+            # Waited on, so that an error it ended with (such as the client vanishing) is retrieved
+            await asyncio.gather(watcher, return_exceptions=True)
+
+
+#############
+""" UTILS """
+#############
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str], bytes]:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Closed before sending a request")
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length is not a number")
+    if length < 0:
+        raise HttpError(400, "Content-Length is negative")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), path.split("?")[0], headers, body
+
+
+def parse_json(data: bytes) -> Any:
+    try:
+        return json.loads(data)
+    except ValueError:
+        raise HttpError(400, "Body is not valid JSON")
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, data: dict[str, Any]) -> None:
+    body = json.dumps(data).encode()
+    writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+async def watch_eof(reader: asyncio.StreamReader) -> None:
+    """Returns once the client has closed its side of the connection"""
+    while await reader.read(1024):
+        pass
+
+
+async def watch_websocket(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Returns once the client closes the WebSocket or asks for the battle to be cancelled. Other
+    messages are ignored, even ones that are not JSON, rather than ending the battle"""
+    while (payload := await read_ws_message(reader, writer)) is not None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            continue
+        if isinstance(message, dict) and message.get("type") == "cancel":
+            return
+
+
+async def read_ws_message(reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+                          ) -> bytes | None:
+    """Payload of the next data frame, answering pings on the way, or None once the client closes"""
+    while True:
+        opcode, payload = await read_ws_frame(reader)
+        if opcode == WS_CLOSE:
+            return None
+        if opcode == WS_PING:
+            writer.write(encode_ws_frame(payload, WS_PONG))
+        elif not opcode & 0x8:  # Pongs and any other control frames are skipped
+            return payload
+
+
+async def read_ws_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """Only whole messages are expected from clients, not ones split over several frames"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY_BYTES:
+        raise ConnectionError(f"WebSocket message larger than {MAX_BODY_BYTES} bytes")
+
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = await reader.readexactly(length)
+    return first & 0x0F, bytes(x ^ mask[i % 4] for i, x in enumerate(payload))
+
+
+def encode_ws_frame(payload: str | bytes, opcode: int = WS_TEXT) -> bytes:
+    """Servers send whole, unmasked frames"""
+    data = payload.encode() if isinstance(payload, str) else payload
+    if len(data) < 126:
+        header = struct.pack("!BB", 0x80 | opcode, len(data))
+    elif len(data) < 2**16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, len(data))
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, len(data))
+    return header + data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs battles for local clients")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=BattleServer().workers,
+                        help="Battles run at once, each in its own process")
+    parser.add_argument("--queue", type=int, default=8, help="Battles waiting, before refusing")
+    args = parser.parse_args()
+    try:
+        asyncio.run(BattleServer(args.host, args.port, args.workers, args.queue).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Immutable records of the state of a battle at a given turn, light enough to keep every one"""
+from typing import Self
+
+from attrs import define
+
+from Globals import Stance
+from Unit import Unit, UnitType
+
+
+@define(frozen=True)
+class UnitSnapshot:
+    """A unit as it was in a given turn, with the same attributes drawing needs from a Unit"""
+    id: int  # Stable for the whole battle, unlike the file which units can slide out of
+    army: int  # 1 or 2
+    unit_type: UnitType
+    stance: Stance
+    file: int
+    position: float
+    init_pos: float
+    morale: float
+    halted: bool
+    # Only known for deployed units, as they depend on their neighbours in the battle
+    eff_morale: float | None = None
+    power_mods: float | None = None
+
+    @classmethod
+    def from_unit(cls, unit: Unit, id: int, army: int, eff_morale: float | None = None,
+                  power_mods: float | None = None) -> Self:
+        return cls(id, army, unit.unit_type, unit.stance, unit.file, unit.position,
+                   unit.init_pos, unit.morale, unit.halted, eff_morale, power_mods)
+
+    @property
+    def name(self) -> str: return self.unit_type.name
+    @property
+    def power(self) -> float: return self.unit_type.power
+    @property
+    def pow_range(self) -> float: return self.unit_type.pow_range
+    @property
+    def mixed(self) -> bool: return self.unit_type.mixed
+    @property
+    def ranged(self) -> bool: return self.unit_type.ranged
+
+
+@define(frozen=True)
+class ArmySnapshot:
+    """Units of one army, each list in the same order as in the Army itself"""
+    deployed: tuple[UnitSnapshot, ...]
+    reserves: tuple[UnitSnapshot, ...]
+    removed: tuple[UnitSnapshot, ...]
+
+
+@define(frozen=True)
+class TurnSnapshot:
+    """Whole battle at the end of a turn, fight pairs are given as the ids of the units"""
+    turn: int
+    army_1: ArmySnapshot
+    army_2: ArmySnapshot
+    two_way_pairs: tuple[tuple[int, int], ...]
+    one_way_pairs: tuple[tuple[int, int], ...]
+
+    @property
+    def armies(self) -> tuple[ArmySnapshot, ArmySnapshot]: return self.army_1, self.army_2
+
+    def get_deployed_by_id(self) -> dict[int, UnitSnapshot]:
+        return {unit.id: unit for army in self.armies for unit in army.deployed}
@@ -0,0 +1,100 @@
+"""Chrome trace event export of battles, to open in chrome://tracing or ui.perfetto.dev and see
+what was happening on the battlefield during the slow turns"""
+import json
+from contextlib import contextmanager
+from functools import partial
+from time import perf_counter
+from typing import Any, Iterator, TextIO
+
+from attrs import define, Factory, field
+
+from Battle import Battle
+from Globals import BattleOutcome
+from Hooks import Hooks, PHASES
+from Unit import Unit
+
+
+@define
+class TraceRecorder:
+    """Trace events of any number of battles, each shown as its own process. Every phase is a
+    span, units removed and reserves deployed are instant events, and the number of fights and
+    deployed units are counters updated every turn"""
+    events: list[dict[str, Any]] = field(init=False, default=Factory(list))
+    start: float = field(init=False, factory=perf_counter)  # Time 0 of the trace
+    battles: int = field(init=False, default=0)
+
+    def make_hooks(self, name: str) -> Hooks:
+        """Hooks for a battle to record its events with, under the given name"""
+        self.battles += 1
+        pid = self.battles
+        self.events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+                            "args": {"name": name}})
+        return Hooks().add(partial(self.add_span, pid), PHASES) \
+                      .add(partial(self.add_counters, pid), ("turn",)) \
+                      .add_context(partial(self.watch_removals, pid), ("tidy",))
+
+    def get_timestamp(self, time: float) -> float:
+        """Microseconds since the start of the trace, given a time from perf_counter"""
+        return round(1e6 * (time - self.start), 3)
+
+    """ EVENTS """
+
+    def add_span(self, pid: int, phase: str, start: float, seconds: float, battle: Battle
+                 ) -> None:
+        self.events.append({"name": phase, "cat": "phase", "ph": "X", "pid": pid, "tid": 0,
+                            "ts": self.get_timestamp(start), "dur": round(1e6 * seconds, 3),
+                            "args": {"turn": battle.turns}})
+
+    def add_counters(self, pid: int, phase: str, start: float, seconds: float, battle: Battle
+                     ) -> None:
+        ts = self.get_timestamp(start + seconds)
+        pairs = battle.fight_pairs
+        self.events.append({"name": "fights", "ph": "C", "pid": pid, "ts": ts,
+                            "args": {"two_way": len(pairs.two_way_pairs),
+                                     "one_way": len(pairs.one_way_pairs)}})
+        self.events.append({"name": "deployed", "ph": "C", "pid": pid, "ts": ts,
+                            "args": {"army_1": len(battle.army_1.file_units),
+                                     "army_2": len(battle.army_2.file_units)}})
+
+    @contextmanager
+    def watch_removals(self, pid: int, phase: str, battle: Battle) -> Iterator[None]:
+        """Units are only ever removed, and reserves deployed in their place, while tidying"""
+        armies = battle.army_1, battle.army_2
+        removed = [len(army.removed) for army in armies]
+        reserves = [list(army.reserves) for army in armies]
+        yield
+
+        ts = self.get_timestamp(perf_counter())
+        for num, army in enumerate(armies, 1):
+            for unit in army.removed[removed[num-1]:]:
+                self.add_unit_event(pid, ts, "removed", battle, unit, num)
+            # Reserves are deployed from the front of the list
+            for unit in reserves[num-1][:len(reserves[num-1]) - len(army.reserves)]:
+                self.add_unit_event(pid, ts, "deployed", battle, unit, num)
+
+    def add_unit_event(self, pid: int, ts: float, name: str, battle: Battle, unit: Unit,
+                       army: int) -> None:
+        self.events.append({"name": name, "cat": "unit", "ph": "i", "s": "p", "pid": pid,
+                            "tid": 0, "ts": ts,
+                            "args": {"id": battle.unit_ids[unit], "unit": unit.name, "army": army,
+                                     "file": unit.file, "position": unit.position,
+                                     "turn": battle.turns}})
+
+    """ SAVING """
+
+    def save(self, fp: str | TextIO) -> None:
+        if isinstance(fp, str):
+            with open(fp, "w", encoding="utf-8") as stream:
+                self.save(stream)
+            return
+        json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, fp,
+                  separators=(",", ":"))
+
+
+def trace_battle(battle: Battle, fp: str | TextIO, name: str = "Battle") -> BattleOutcome:
+    """Fights the battle and writes its trace, replacing any hooks it had"""
+    recorder = TraceRecorder()
+    battle.hooks = recorder.make_hooks(name)
+    outcome = battle.do(0)
+    recorder.save(fp)
+    return outcome
@@ -0,0 +1,208 @@
+"""Headless benchmark of the engine on every scenario of testing_battle.py and testing_18C.py,
+timing each phase of the turns. Run as "python bench_engine.py [A1 18C_E2 ...]", all scenarios if
+none are given. --save writes the results as JSON, --compare checks them against ones saved before
+and fails with exit code 1 on regressions, --trace writes a Chrome trace of one run of each"""
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from statistics import median
+from time import perf_counter
+from types import ModuleType
+from typing import Any, Callable, Iterator
+
+from Battle import Battle
+from Geography import Landscape
+from Hooks import Hooks, PhaseHistogram
+from Trace import TraceRecorder
+from Unit import Army
+import testing_18C
+import testing_battle
+
+PHASES = ("tidy", "fight", "move")
+REPEATS = 5         # Timings are of the quickest run, the least disturbed by everything else
+THRESHOLD = 0.15    # Slower or bigger than the baseline by more than this fraction is a regression
+MIN_DIFF_MS = 1.0   # Smaller slowdowns are noise, however large a fraction they are
+MODULES = {"": testing_battle, "18C_": testing_18C}  # Scenario names are prefixed with the key
+
+
+@contextmanager
+def timing_methods(methods: dict[str, tuple[type, str]], seconds: dict[str, float],
+                   exclusive: bool = False) -> Iterator[None]:
+    """Adds up the time spent in each method (or property) of a class while in the context, by
+    name. If exclusive, time spent in one of them called from within another only counts once"""
+    originals = {name: vars(cls)[attr] for name, (cls, attr) in methods.items()}
+    nested = [0.0]  # Time spent in timed methods called by the one running right now
+
+    def wrap(name: str, func: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            outer, nested[0] = nested[0], 0.0
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                seconds[name] += elapsed - nested[0] if exclusive else elapsed
+                nested[0] = outer + elapsed
+        return timed
+
+    for name, (cls, attr) in methods.items():
+        original = originals[name]
+        if isinstance(original, property) and original.fget is not None:
+            setattr(cls, attr, property(wrap(name, original.fget)))
+        else:
+            setattr(cls, attr, wrap(name, original))
+    try:
+        yield
+    finally:
+        for name, (cls, attr) in methods.items():
+            setattr(cls, attr, originals[name])
+
+
+""" SCENARIOS """
+
+
+def get_scenarios(names: list[str]) -> dict[str, tuple[ModuleType, Callable]]:
+    scenarios = {prefix + name.removeprefix("test_"): (module, func)
+                 for prefix, module in MODULES.items()
+                 for name, func in vars(module).items()
+                 if name.startswith("test_") and callable(func)}
+    return {name: scenarios[name] for name in names} if names else scenarios
+
+
+def set_up(module: ModuleType, scenario: Callable) -> tuple[Army, Army, Landscape]:
+    """New armies and landscape of the scenario, without fighting it"""
+    captured = []
+
+    def runner(army_1, army_2, landscape, max_pixels_x):
+        captured.append((army_1, army_2, landscape))
+
+    setattr(module, "runner", runner)
+    try:
+        scenario()
+    finally:
+        setattr(module, "runner", None)
+    return captured[0]
+
+
+""" MEASURING """
+
+
+def time_scenario(module: ModuleType, scenario: Callable, repeats: int) -> dict[str, Any]:
+    runs = []
+    for _ in range(repeats):
+        histogram = PhaseHistogram()
+        battle = Battle(*set_up(module, scenario), hooks=Hooks().add(histogram, PHASES))
+        start = perf_counter()
+        outcome = battle.do(0)
+        runs.append((perf_counter() - start, battle, histogram))
+    seconds, battle, histogram = min(runs, key=lambda run: run[0])
+
+    return {"outcome": outcome.name,
+            "turns": battle.turns,
+            "seconds": seconds,
+            "median_seconds": median(run[0] for run in runs),
+            "turns_per_second": battle.turns / seconds,
+            "phase_seconds": histogram.seconds,
+            "peak_kib": measure_peak_kib(module, scenario)}
+
+
+def measure_peak_kib(module: ModuleType, scenario: Callable) -> float:
+    """Separate run, as tracing every allocation slows the battle down a few times over.
+    Includes setting up the armies and landscape"""
+    tracemalloc.start()
+    try:
+        Battle(*set_up(module, scenario)).do(0)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def trace_scenarios(scenarios: dict[str, tuple[ModuleType, Callable]], fp: str) -> None:
+    """One more run of each scenario, all in the same trace"""
+    recorder = TraceRecorder()
+    for name, (module, scenario) in scenarios.items():
+        battle = Battle(*set_up(module, scenario), hooks=recorder.make_hooks(name))
+        battle.do(0)
+    recorder.save(fp)
+
+
+""" REPORTING """
+
+
+def print_results(results: dict[str, dict]) -> None:
+    print(f"{'Scenario':<10} {'Outcome':<10} {'Turns':>5} {'ms':>8} {'Turns/s':>8}"
+          + "".join(f" {phase + ' ms':>8}" for phase in PHASES) + f" {'Peak KiB':>9}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['outcome']:<10} {result['turns']:>5} "
+              f"{1000*result['seconds']:>8.1f} {result['turns_per_second']:>8.0f}"
+              + "".join(f" {1000*result['phase_seconds'][x]:>8.1f}" for x in PHASES)
+              + f" {result['peak_kib']:>9.0f}")
+
+    total = sum(result["seconds"] for result in results.values())
+    turns = sum(result["turns"] for result in results.values())
+    print(f"{'Total':<10} {'':<10} {turns:>5} {1000*total:>8.1f} {turns/total:>8.0f}"
+          + "".join(f" {1000*sum(x['phase_seconds'][phase] for x in results.values()):>8.1f}"
+                    for phase in PHASES))
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> bool:
+    """Prints how every scenario changed, returns whether any got slower, bigger, or ended
+    differently. Battles are deterministic, so any change of outcome or turns is a regression"""
+    regressed = False
+    print(f"\n{'Scenario':<10} {'Base ms':>8} {'ms':>8} {'Ratio':>6} {'Base KiB':>9} {'KiB':>9}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<10} not in baseline")
+            continue
+        base = baseline[name]
+        ratio = result["seconds"] / base["seconds"]
+        flags = []  # In capitals if a regression
+        if ratio > 1 + threshold and 1000*(result["seconds"]-base["seconds"]) > MIN_DIFF_MS:
+            flags.append("SLOWER")
+        if result["peak_kib"] > base["peak_kib"] * (1 + threshold):
+            flags.append("BIGGER")
+        if (result["outcome"], result["turns"]) != (base["outcome"], base["turns"]):
+            flags.append(f"CHANGED from {base['outcome']} in {base['turns']} turns")
+        regressed |= bool(flags)
+        if ratio < 1 - threshold:
+            flags.append("faster")
+        print(f"{name:<10} {1000*base['seconds']:>8.1f} {1000*result['seconds']:>8.1f} "
+              f"{ratio:>6.2f} {base['peak_kib']:>9.0f} {result['peak_kib']:>9.0f}  "
+              + " ".join(flags))
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scenarios", nargs="*", help="e.g. A1 or 18C_A1, all if none")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--save", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="JSON file of results saved before, as a baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--trace", help="file to write a Chrome trace of the scenarios to")
+    args = parser.parse_args()
+
+    scenarios = get_scenarios(args.scenarios)
+    results = {name: time_scenario(module, scenario, args.repeats)
+               for name, (module, scenario) in scenarios.items()}
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "repeats": args.repeats, "results": results}, file, indent=1)
+    if args.trace:
+        trace_scenarios(scenarios, args.trace)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Size and encode-time comparison of every Animation format, across the scenarios of
+testing_battle.py. Run as "python bench_formats.py [A1 H4 ...]", all scenarios if none are given"""
+import argparse
+import sys
+from io import BytesIO
+from time import perf_counter
+
+from Animation import Animation
+from GraphicBattle import GraphicBattle
+import testing_battle
+
+# Name in the results, then arguments to Animation.save
+VARIANTS = {"gif": ("gif", False),
+            "gif_delta": ("gif", True),
+            "webp": ("webp", False),
+            "webp_lossy": ("webp_lossy", False),
+            "apng": ("apng", False),
+            "sprites": ("sprites", False)}
+
+
+def get_scenarios() -> dict:
+    return {name.removeprefix("test_"): func for name, func in vars(testing_battle).items()
+            if name.startswith("test_") and callable(func)}
+
+
+def make_animation(scenario) -> Animation:
+    """Runs the scenario once, to draw the frames every format is then encoded from"""
+    animations = []
+
+    def runner(army_1, army_2, landscape, max_pixels_x):
+        battle = GraphicBattle(army_1, army_2, landscape, max_pixels_x, "bench_out")
+        animations.append(battle.do_to_animation())
+
+    testing_battle.runner = runner
+    try:
+        scenario()
+    finally:
+        testing_battle.runner = None
+    return animations[0]
+
+
+def time_encode(animation: Animation, image_format: str, delta: bool) -> tuple[int, float]:
+    """Size in bytes and encode time in seconds"""
+    stream = BytesIO()
+    start = perf_counter()
+    animation.save(stream, image_format, delta=delta)
+    return stream.getbuffer().nbytes, perf_counter() - start
+
+
+def main() -> int:
+    all_scenarios = get_scenarios()
+    parser = argparse.ArgumentParser(description=__doc__)
+    # Checked below rather than with choices, which rejects giving no names at all before 3.12
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"any of {', '.join(all_scenarios)}, all if none")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in all_scenarios]
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(unknown)}")
+    scenarios = {name: all_scenarios[name] for name in args.scenarios} or all_scenarios
+    totals = {variant: [0, 0.0] for variant in VARIANTS}
+
+    print(f"{'Scenario':<10} {'Frames':>6}" + "".join(f" {x:>19}" for x in VARIANTS))
+    print(f"{'':<10} {'':>6}" + " {:>10} {:>8}".format("kB", "s") * len(VARIANTS))
+    for name, scenario in scenarios.items():
+        animation = make_animation(scenario)
+        row = f"{name:<10} {len(animation.frames):>6}"
+        for variant, (image_format, delta) in VARIANTS.items():
+            size, elapsed = time_encode(animation, image_format, delta)
+            totals[variant][0] += size
+            totals[variant][1] += elapsed
+            row += f" {size/1000:>10.0f} {elapsed:>8.2f}"
+        print(row)
+
+    print(f"{'Total':<10} {'':>6}" + "".join(f" {size/1000:>10.0f} {elapsed:>8.2f}"
+                                            for size, elapsed in totals.values()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
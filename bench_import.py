@@ -0,0 +1,56 @@
+"""Import-time benchmark: checks that headless modules never load the graphics stack, and that
+each module imports within budget. Run as "python bench_import.py", fails with exit code 1"""
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+
+REPEATS = 5
+HEAVY_MODULES = ("numpy", "PIL.Image", "matplotlib")
+
+# Cumulative import time allowed for each module in ms, generous to allow for slow machines
+BUDGET_MS = {"Geography": 60,
+             "Unit": 60,
+             "Battle": 60,
+             "Data": 60,
+             "Animation": 80,
+             "GraphicBattle": 120}
+
+
+def time_import(module: str) -> float:
+    """Cumulative import time in ms according to "python -X importtime", in a fresh process"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=Path(__file__).parent, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        # Format is "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise ValueError(f"{module} not found in import times")
+
+
+def find_heavy_loaded(module: str) -> list[str]:
+    """Lazily imported modules count as loaded only once they have actually been executed"""
+    code = f"import sys, {module}\n" \
+           f"print(*(x for x in {HEAVY_MODULES} if x in sys.modules and " \
+           f"type(sys.modules[x]).__name__ == 'module'))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+def main() -> int:
+    failed = False
+    print(f"{'Module':<15} {'Median ms':>10} {'Budget ms':>10}  Heavy modules loaded")
+    for module, budget in BUDGET_MS.items():
+        elapsed = median(time_import(module) for _ in range(REPEATS))
+        heavy = find_heavy_loaded(module)
+        over = elapsed > budget or bool(heavy)
+        failed |= over
+        print(f"{module:<15} {elapsed:>10.1f} {budget:>10}  {', '.join(heavy) or '-'}"
+              f"{'  <-- FAIL' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
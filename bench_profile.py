@@ -0,0 +1,174 @@
+"""Profiles the engine on a set of scenarios, from testing_battle.py and testing_18C.py by name or
+from a JSON file of Scenario dicts, to see where the time goes. Every run of every scenario adds to
+the same profile. Prints the top functions by own time and the time spent in each module, and
+--collapsed writes stacks made from the same profile, in microseconds, for flamegraph.pl, speedscope
+or inferno. --draw fights them as GraphicBattle so that drawing the Scene is included. Run as
+"python bench_profile.py [A1 18C_E2 ...] [--file scenarios.json] [--draw 720]", every testing
+scenario if neither names nor a file are given"""
+import argparse
+import cProfile
+import json
+import pstats
+import sys
+from collections import Counter
+from functools import partial
+from os.path import basename
+from typing import Callable
+
+from Battle import Battle
+from Geography import Landscape
+from GraphicBattle import GraphicBattle
+from Scenario import Scenario
+from Unit import Army
+from bench_engine import get_scenarios, set_up
+
+TOP = 30  # Functions in the table
+SORT_KEYS = ("tottime", "cumulative", "ncalls")
+
+# Called with no arguments to get new armies and landscape for one run of a scenario
+SetUp = Callable[[], tuple[Army, Army, Landscape]]
+# How pstats names a function: file, first line and name, or "~", 0 and name if built in
+Function = tuple[str, int, str]
+
+
+""" SCENARIOS """
+
+
+def load_scenario_file(path: str) -> dict[str, SetUp]:
+    """A list of Scenario dicts, named by their index, or a dict of them by name"""
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    items = data.items() if isinstance(data, dict) else enumerate(data)
+    return {f"{basename(path)}:{name}": partial(set_up_scenario, Scenario.from_dict(scenario))
+            for name, scenario in items}
+
+
+def set_up_scenario(scenario: Scenario) -> tuple[Army, Army, Landscape]:
+    return *scenario.make_armies(), scenario.make_landscape()
+
+
+def get_set_ups(names: list[str], path: str | None) -> dict[str, SetUp]:
+    set_ups: dict[str, SetUp] = {}
+    if names or not path:
+        for name, (module, scenario) in get_scenarios(names).items():
+            set_ups[name] = partial(set_up, module, scenario)
+    if path:
+        set_ups |= load_scenario_file(path)
+    return set_ups
+
+
+def run_battle(set_up_battle: SetUp, draw: int | None) -> None:
+    """Fights one battle, drawing it at the given width if any. The outermost profiled frame"""
+    if draw:
+        GraphicBattle(*set_up_battle(), draw, "profile_out").do_to_animation()
+    else:
+        Battle(*set_up_battle()).do(0)
+
+
+""" PROFILING """
+
+
+def profile_runs(set_ups: dict[str, SetUp], repeats: int, draw: int | None) -> pstats.Stats:
+    profile = cProfile.Profile()
+    for set_up_battle in set_ups.values():
+        for _ in range(repeats):
+            profile.runcall(run_battle, set_up_battle, draw)
+    return pstats.Stats(profile)
+
+
+def build_stacks(stats: pstats.Stats) -> Counter[tuple[str, ...]]:
+    """Own time in microseconds of every stack from run_battle down. cProfile only keeps the time
+    of each caller and callee pair, not whole stacks, so the time of a function is split between
+    the stacks that reach it in proportion to the time it was called for from each. Exact for
+    functions only ever called from one place, an estimate for the rest"""
+    entries = stats.stats  # type: ignore[attr-defined]
+    callees: dict[Function, dict[Function, float]] = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, seconds) in callers.items():
+            callees.setdefault(caller, {})[function] = seconds
+    stacks: Counter[tuple[str, ...]] = Counter()
+
+    def add(function: Function, stack: tuple[str, ...], path: set[Function],
+            seconds: float) -> None:
+        _, _, own, cumulative, _ = entries[function]
+        if seconds < 1e-6 or cumulative <= 0:  # Too little to show, and stops the walk early
+            return
+        share = min(seconds / cumulative, 1)  # Calls that recurse are counted again by callers
+        stack = (*stack, get_function_name(function))
+        stacks[stack] += round(1e6 * own * share)
+        for callee, callee_seconds in callees.get(function, {}).items():
+            if callee not in path:  # Recursive calls are already in the time of the outermost
+                add(callee, stack, path | {callee}, callee_seconds * share)
+
+    code = run_battle.__code__
+    root = (code.co_filename, code.co_firstlineno, code.co_name)
+    add(root, (), {root}, entries[root][3])
+    return +stacks  # Drops those rounded down to nothing
+
+
+""" REPORTING """
+
+
+def get_module_seconds(stats: pstats.Stats) -> dict[str, float]:
+    """Own time of the functions of each file, most first. Builtins have no file in pstats, so
+    are all put together under "~" """
+    seconds: Counter[str] = Counter()
+    for (file, _, _), (_, _, own, _, _) in stats.stats.items():  # type: ignore[attr-defined]
+        seconds[basename(file)] += own
+    return dict(seconds.most_common())
+
+
+def print_modules(stats: pstats.Stats) -> None:
+    module_seconds = get_module_seconds(stats)
+    total = sum(module_seconds.values())
+    print(f"{'Module':<36} {'Own s':>8} {'%':>6}")
+    for module, seconds in module_seconds.items():
+        if seconds >= 0.001 * total:
+            print(f"{module:<36} {seconds:>8.3f} {100*seconds/total:>6.1f}")
+
+
+def get_function_name(function: Function) -> str:
+    file, line, name = function
+    return name if file == "~" else f"{name} ({basename(file)}:{line})"
+
+
+def write_collapsed(stacks: Counter[tuple[str, ...]], path: str) -> None:
+    """One line per stack, its frames from the outermost joined by ";" then its microseconds"""
+    with open(path, "w", encoding="utf-8") as file:
+        for stack, count in sorted(stacks.items()):
+            file.write(f"{';'.join(stack)} {count}\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scenarios", nargs="*", help="e.g. A1 or 18C_A1")
+    parser.add_argument("--file", help="JSON file of Scenario dicts, as a list or by name")
+    parser.add_argument("--repeats", type=int, default=1, help="runs of each scenario")
+    parser.add_argument("--draw", type=int, metavar="PIXELS",
+                        help="fight as GraphicBattle, drawing frames this wide")
+    parser.add_argument("--top", type=int, default=TOP, help="functions in the table")
+    parser.add_argument("--sort", default=SORT_KEYS[0], choices=SORT_KEYS)
+    parser.add_argument("--pstats", help="file to dump the profile to, for snakeviz and the like")
+    parser.add_argument("--collapsed", help="file to write collapsed stacks to")
+    args = parser.parse_args()
+    try:
+        set_ups = get_set_ups(args.scenarios, args.file)
+    except KeyError as error:
+        parser.error(f"unknown scenario {error}")
+
+    stats = profile_runs(set_ups, args.repeats, args.draw)
+    print(f"{len(set_ups)} scenarios, {args.repeats} runs of each\n")
+    print_modules(stats)
+    stats.sort_stats(args.sort).print_stats(args.top)
+    if args.pstats:
+        stats.dump_stats(args.pstats)
+
+    if args.collapsed:
+        stacks = build_stacks(stats)
+        write_collapsed(stacks, args.collapsed)
+        print(f"{len(stacks)} stacks of {stacks.total() / 1e6:.3f} s written to {args.collapsed}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Rendering benchmark of GraphicBattle and Scene: setting up the scene, drawing each frame broken
+down by what is drawn, and encoding the gif, at several resolutions on every PresetLandscapes map.
+Run as "python bench_render.py [valley ridge ...] [--resolutions 720 1600]", all maps if none are
+given. Each case runs in a fresh process, so that caches start empty and peak memory is its own"""
+import argparse
+import json
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from time import perf_counter
+
+from Config import DELTA_T
+from Data import landscape_dict, spear, sword, pike, archer, mixed, h_horse, l_horse
+from Globals import Stance
+from GraphicBattle import GraphicBattle, Scene
+from Unit import Army
+from bench_engine import timing_methods
+
+RESOLUTIONS = (720, 1080, 1600)
+
+# Timed exclusively, so none include time spent in the others
+SCENE_METHODS = {"terrain": (Scene, "draw_background_file"),
+                 "contours": (Scene, "draw_contour_lines_on_background"),
+                 "contour_graph": (Scene, "plot_contour_graph"),
+                 "height_labels": (Scene, "draw_background_height_labels"),
+                 "background_other": (Scene, "render_background"),
+                 "scene_other": (Scene, "__attrs_post_init__")}
+FRAME_METHODS = {"background": (Scene, "init_draw_frame"),
+                 "sprites": (Scene, "get_unit_sprite"),
+                 "unit_text": (Scene, "draw_unit_text"),
+                 "counter": (Scene, "draw_counter"),
+                 "paste": (Scene, "draw_unit"),
+                 "arrows": (Scene, "draw_fight"),
+                 "frame_other": (GraphicBattle, "draw_snapshot")}
+COLUMNS = ("scene", *SCENE_METHODS, "frames", "frame", *FRAME_METHODS, "battle", "encode", "kB",
+           "peak_mib")
+
+
+def make_armies() -> tuple[Army, Army]:
+    """Every kind of unit over 7 files, so the scene spans most of each map"""
+    army_1 = Army("Army 1", Stance.BAL, "DarkBlue")
+    army_2 = Army("Army 2", Stance.DEF, "DarkRed")
+    army_1.add(-3, l_horse).add(-2, spear).add(-1, pike).add(0, pike).add(1, spear)
+    army_1.add(2, archer).add(3, h_horse).add_reserves(sword, sword)
+    army_2.add(-3, h_horse).add(-2, sword).add(-1, mixed).add(0, sword).add(1, mixed)
+    army_2.add(2, sword).add(3, l_horse).add_reserves(archer, spear)
+    return army_1, army_2
+
+
+""" MEASURING """
+
+
+def run_case(landscape: str, max_pixels_x: int, palette_mode: bool, backend: str,
+             frame_time: float) -> dict:
+    """Times in ms, those of frame methods per frame drawn. Peak memory is the growth of the
+    maximum resident set size over the imports"""
+    import_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = dict.fromkeys({**SCENE_METHODS, **FRAME_METHODS}, 0.0)
+
+    with timing_methods(SCENE_METHODS | FRAME_METHODS, seconds, exclusive=True):
+        start = perf_counter()
+        battle = GraphicBattle(*make_armies(), landscape_dict[landscape](), max_pixels_x,
+                               "bench_out", palette_mode=palette_mode, backend=backend,
+                               frame_time=frame_time)
+        scene_seconds = perf_counter() - start
+        animation = battle.do_to_animation()
+        total_seconds = perf_counter() - start
+
+    stream = BytesIO()
+    start = perf_counter()
+    animation.save(stream, "gif")
+    encode_seconds = perf_counter() - start
+
+    frames = battle.scene.frame_count
+    frame_seconds = sum(seconds[name] for name in FRAME_METHODS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - import_peak
+    return {"scene": 1000*scene_seconds,
+            **{name: 1000*seconds[name] for name in SCENE_METHODS},
+            "frames": frames,
+            "frame": 1000*frame_seconds / frames,
+            **{name: 1000*seconds[name] / frames for name in FRAME_METHODS},
+            "battle": 1000*(total_seconds - scene_seconds - frame_seconds),
+            "encode": 1000*encode_seconds,
+            "kB": stream.getbuffer().nbytes / 1000,
+            "peak_mib": peak / 1024}  # ru_maxrss is in KiB on Linux
+
+
+""" REPORTING """
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("landscapes", nargs="*", help="names in Data.landscape_dict, all if none")
+    parser.add_argument("--resolutions", nargs="+", type=int, default=RESOLUTIONS)
+    parser.add_argument("--palette", action="store_true", help="draw in palette mode")
+    parser.add_argument("--backend", default="pillow", choices=("pillow", "numpy"))
+    parser.add_argument("--frame-time", type=float, default=DELTA_T,
+                        help="simulated time between frames, larger to draw fewer")
+    parser.add_argument("--save", help="file to write the results to as JSON")
+    args = parser.parse_args()
+    if unknown := set(args.landscapes) - set(landscape_dict):
+        parser.error(f"unknown landscapes {', '.join(unknown)}")
+
+    widths = {name: max(7, len(name)) for name in COLUMNS}
+    print("Times in ms, those from frame to frame_other are per frame drawn")
+    print(f"{'Landscape':<15} {'Pixels':>6}" + "".join(f" {x:>{widths[x]}}" for x in COLUMNS))
+
+    results = []
+    for landscape in args.landscapes or landscape_dict:
+        for max_pixels_x in args.resolutions:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(run_case, landscape, max_pixels_x, args.palette,
+                                     args.backend, args.frame_time).result()
+            results.append({"landscape": landscape, "max_pixels_x": max_pixels_x} | result)
+            print(f"{landscape:<15} {max_pixels_x:>6}"
+                  + "".join(f" {result[x]:>{widths[x]}.1f}" for x in COLUMNS))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"palette": args.palette, "backend": args.backend,
+                       "frame_time": args.frame_time, "results": results}, file, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Scaling benchmark of the engine on generated battles, far wider and deeper than any scenario.
+Each sweep grows one size: the number of files, the number of reserves, or the number of all_sides
+units (Data.cannon). Time per turn of each phase, and of the methods suspected to be super-linear,
+is then fitted as a power of the size. Run as "python bench_scaling.py [files reserves all_sides]",
+all sweeps if none are given, --save writes the results as JSON"""
+import argparse
+import json
+import sys
+from math import exp, inf, log
+from statistics import linear_regression
+from time import perf_counter
+from typing import Any
+
+from Battle import Battle, FightPairs
+from Data import line, light, grenadier, cannon, even
+from Geography import Landscape
+from Globals import Stance
+from Hooks import Hooks, PhaseHistogram
+from Unit import Army
+from bench_engine import PHASES, timing_methods
+
+# Name of each sweep, then (size, files, reserves, all_sides units) of the battles in it
+SWEEPS = {"files": [(n, n, 2, 0) for n in (5, 10, 20, 50, 100, 200)],
+          "reserves": [(n, 10, n, 0) for n in (1, 2, 5, 10, 20, 50, 100)],
+          "all_sides": [(n, 40, 2, n) for n in (1, 2, 5, 10, 20, 40)]}
+
+# Timed on their own as well as within their phase
+HOTSPOTS = {"assign_all": (FightPairs, "assign_all"),
+            "laggard_speed": (Army, "get_minimum_laggard_speed"),
+            "blocking_unit": (Army, "get_blocking_unit"),
+            "reserve_power": (Army, "reserve_power")}
+
+SUPER_LINEAR = 1.2  # Exponents above this are flagged
+ROSTERS = ([line, grenadier, light], [light, line, grenadier])  # Cycled through by each army
+
+
+""" SCENARIOS """
+
+
+def make_scenario(files: int, reserves: int, all_sides: int) -> tuple[Army, Army, Landscape]:
+    """Both armies deploy on the same files around 0, with their all_sides units spread evenly
+    among them, and fight on even ground"""
+    file_range = range(-(files//2), files - files//2)
+    armies = []
+    for num, roster in enumerate(ROSTERS, 1):
+        army = Army(f"Army {num}", Stance.BAL)
+        for i, file in enumerate(file_range):
+            spread = (i+1)*all_sides//files > i*all_sides//files
+            army.add(file, cannon if spread else roster[i % len(roster)])
+        army.add_reserves(*(roster[i % len(roster)] for i in range(reserves)))
+        armies.append(army)
+    landscape = Landscape({file: {inf: even} for file in file_range})
+    return armies[0], armies[1], landscape
+
+
+""" MEASURING """
+
+
+def time_battle(files: int, reserves: int, all_sides: int) -> dict:
+    """Milliseconds per turn of the whole turn, each phase and each hotspot"""
+    histogram = PhaseHistogram()
+    hooks = Hooks().add(histogram, PHASES)
+    battle = Battle(*make_scenario(files, reserves, all_sides), hooks=hooks)
+    hotspots = dict.fromkeys(HOTSPOTS, 0.0)
+    with timing_methods(HOTSPOTS, hotspots):
+        start = perf_counter()
+        outcome = battle.do(0)
+        seconds = perf_counter() - start
+
+    per_turn = {"turn": seconds} | histogram.seconds | hotspots
+    return {"outcome": outcome.name, "turns": battle.turns,
+            "ms_per_turn": {name: 1000*x / battle.turns for name, x in per_turn.items()}}
+
+
+def fit_power_law(sizes: list[float], times: list[float]) -> tuple[float, float]:
+    """(k, c) of time = c * size**k, by least squares on their logarithms"""
+    slope, intercept = linear_regression([log(x) for x in sizes], [log(y) for y in times])
+    return slope, exp(intercept)
+
+
+def get_local_exponents(sizes: list[float], times: list[float]) -> list[float]:
+    """Exponent between each size and the next, to see where growth speeds up"""
+    return [log(times[i+1]/times[i]) / log(sizes[i+1]/sizes[i]) for i in range(len(sizes)-1)]
+
+
+""" REPORTING """
+
+
+def run_sweep(name: str) -> dict:
+    columns = ["turn", *PHASES, *HOTSPOTS]
+    print(f"\nSweep over {name}\n{'Size':>5} {'Outcome':<10} {'Turns':>5}"
+          + "".join(f" {x:>13}" for x in columns) + "    (ms per turn)")
+
+    sizes: list[float] = []
+    rows = []
+    for size, files, reserves, all_sides in SWEEPS[name]:
+        result = time_battle(files, reserves, all_sides)
+        sizes.append(size)
+        rows.append(result | {"size": size, "files": files, "reserves": reserves,
+                              "all_sides": all_sides})
+        print(f"{size:>5} {result['outcome']:<10} {result['turns']:>5}"
+              + "".join(f" {result['ms_per_turn'][x]:>13.3f}" for x in columns))
+
+    fits: dict[str, dict[str, Any]] = {}
+    for column in columns:
+        times = [row["ms_per_turn"][column] for row in rows]
+        if min(times) <= 0:  # Never called in this sweep
+            continue
+        exponent, _ = fit_power_law(sizes, times)
+        fits[column] = {"exponent": exponent, "local": get_local_exponents(sizes, times)}
+
+    print(f"{'Exponent':<22}" + "".join(f" {fits[x]['exponent']:>13.2f}" if x in fits
+                                        else f" {'-':>13}" for x in columns))
+    print(f"{'Last exponent':<22}" + "".join(f" {fits[x]['local'][-1]:>13.2f}" if x in fits
+                                             else f" {'-':>13}" for x in columns))
+    flagged = [x for x in fits if fits[x]["exponent"] > SUPER_LINEAR]
+    print(f"Super-linear in {name}: {', '.join(flagged) or 'none'}")
+    return {"battles": rows, "fits": fits}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sweeps", nargs="*", help=f"any of {', '.join(SWEEPS)}, all if none")
+    parser.add_argument("--save", help="file to write the results to as JSON")
+    args = parser.parse_args()
+    if unknown := set(args.sweeps) - set(SWEEPS):
+        parser.error(f"unknown sweeps {', '.join(unknown)}")
+
+    results = {name: run_sweep(name) for name in args.sweeps or SWEEPS}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Microbenchmark of Unit: reading each of its type parameters, creating units and their memory, on
+a batch of 100k units of every type in Data. Run as "python bench_units.py", --save writes the
+results as JSON and --compare prints how they changed from ones saved before"""
+import argparse
+import json
+import sys
+import tracemalloc
+from itertools import cycle, islice
+from operator import attrgetter
+from time import perf_counter
+
+from Data import unit_dict, units_18C_dict
+from Globals import Stance
+from Unit import TYPE_PARAMETERS, Unit
+
+COUNT = 100_000
+REPEATS = 7  # Timings are of the quickest run
+
+
+def make_units(count: int) -> list[Unit]:
+    types = islice(cycle([*unit_dict.values(), *units_18C_dict.values()]), count)
+    return [Unit(unit_type, Stance.BAL, i % 11 - 5) for i, unit_type in enumerate(types)]
+
+
+""" MEASURING """
+
+
+def time_reads(units: list[Unit], name: str, repeats: int) -> float:
+    """Nanoseconds per read of the attribute, over the whole batch"""
+    getter = attrgetter(name)
+    best = float("inf")
+    for _ in range(repeats):
+        start = perf_counter()
+        for unit in units:
+            getter(unit)
+        best = min(best, perf_counter() - start)
+    return 1e9 * best / len(units)
+
+
+def time_creation(count: int, repeats: int) -> float:
+    """Microseconds per unit created"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = perf_counter()
+        make_units(count)
+        best = min(best, perf_counter() - start)
+    return 1e6 * best / count
+
+
+def measure_bytes(count: int) -> float:
+    """Bytes allocated per unit, the unit types being shared and made beforehand"""
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        units = make_units(count)
+        return (tracemalloc.get_traced_memory()[0] - start) / len(units)
+    finally:
+        tracemalloc.stop()
+
+
+""" REPORTING """
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=COUNT)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--save", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="JSON file of results saved before, as a baseline")
+    args = parser.parse_args()
+
+    units = make_units(args.count)
+    results = {f"read_{name}_ns": time_reads(units, name, args.repeats)
+               for name in TYPE_PARAMETERS}
+    results["create_us"] = time_creation(args.count, args.repeats)
+    results["bytes_per_unit"] = measure_bytes(args.count)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    print(f"{args.count} units\n{'Measure':<24} {'Value':>8}"
+          + (f" {'Base':>8} {'Ratio':>6}" if baseline else ""))
+    for name, value in results.items():
+        line = f"{name:<24} {value:>8.1f}"
+        if name in baseline:
+            line += f" {baseline[name]:>8.1f} {value/baseline[name]:>6.2f}"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({"count": args.count, "results": results}, file, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
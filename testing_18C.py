@@ -1,4 +1,5 @@
 from math import inf
+from typing import Callable
 
 from Battle import Battle
 from Data import smooth, even, rough, broken, ragged, forest, river, PresetLandscapes, \
@@ -9,19 +10,27 @@ from GraphicBattle import GraphicBattle
 from Unit import Army
 
 graphical = True
+# If set, every test hands its battle to this instead, see testing_battle.runner
+runner: Callable | None = None
 
 
 def preamble():
     return Army("Army 1", Stance.BAL, "DarkBlue"), Army("Army 2", Stance.BAL, "DarkRed")
 
 
+def run_battle(army_1, army_2, landscape, max_pixels_x=800, name="modern_out"):
+    if runner is not None:
+        runner(army_1, army_2, landscape, max_pixels_x)
+    elif graphical:
+        GraphicBattle(army_1, army_2, landscape, max_pixels_x, name).do(10)
+    else:
+        Battle(army_1, army_2, landscape).do(10)
+
+
 def do_single_terrain_battle(army_1, army_2, terrain, name="modern_out"):
     files = set(army_1.file_units) | set(army_2.file_units)
     landscape = Landscape({file: {inf: terrain} for file in files})
-    if graphical:
-        GraphicBattle(army_1, army_2, landscape, 800, name).do(10)
-    else:
-        Battle(army_1, army_2, landscape).do(10)
+    run_battle(army_1, army_2, landscape, 800, name)
 
 
 """ Infantry trichotomy """
@@ -156,4 +165,5 @@ def test_E2():
     do_single_terrain_battle(army_1, army_2, rough)  # Note - not even
 
 
-test_E2()
+if __name__ == "__main__":
+    test_E2()
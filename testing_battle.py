@@ -1,5 +1,6 @@
 """Mostly balance tests and some visual checks of behaviour, not proper unit tests"""
 from math import inf
+from typing import Callable
 
 from Battle import Battle
 from Data import smooth, even, rough, broken, ragged, forest, river, PresetLandscapes, \
@@ -10,19 +11,28 @@ from GraphicBattle import GraphicBattle
 from Unit import Army
 
 graphical = True
+# If set, every test hands its battle to this instead, e.g. for benchmarks to run their own way.
+# Called as runner(army_1, army_2, landscape, max_pixels_x)
+runner: Callable | None = None
 
 
 def preamble():
     return Army("Army 1", Stance.BAL, "DarkBlue"), Army("Army 2", Stance.BAL, "DarkRed")
 
 
+def run_battle(army_1, army_2, landscape, max_pixels_x=720, name="testing_out"):
+    if runner is not None:
+        runner(army_1, army_2, landscape, max_pixels_x)
+    elif graphical:
+        GraphicBattle(army_1, army_2, landscape, max_pixels_x, name).do(10)
+    else:
+        Battle(army_1, army_2, landscape).do(10)
+
+
 def do_single_terrain_battle(army_1, army_2, terrain, name="testing_out"):
     files = set(army_1.file_units) | set(army_2.file_units)
     landscape = Landscape({file: {inf: terrain} for file in files})
-    if graphical:
-        GraphicBattle(army_1, army_2, landscape, 720, name).do(10)
-    else:
-        Battle(army_1, army_2, landscape).do(10)
+    run_battle(army_1, army_2, landscape, 720, name)
 
 
 """ spear - sword - pike trichotomy """
@@ -253,7 +263,7 @@ def test_E2():
                            0: {inf: smooth},
                            1: {inf: river}})
 
-    GraphicBattle(army_1, army_2, landscape, 720, "testing_out").do(verbosity=10)
+    run_battle(army_1, army_2, landscape, 720)
 
 
 def test_E3():
@@ -343,7 +353,7 @@ def test_G1():
     terrain = {0: {-2.5: rough, -1.5: broken, -0.5: even, 0: ragged,
                    0.5: smooth, 1: even, 2: forest, 3: river, 4: ragged, inf: even}}
     landscape = Landscape(terrain, {})
-    GraphicBattle(army_1, army_2, landscape, 600, "testing_out").do(10)
+    run_battle(army_1, army_2, landscape, 600)
 
 
 def test_G2():
@@ -357,7 +367,7 @@ def test_G2():
     terrain = {0: {inf: even}}
     height = {(0, -4): 6.1, (0, 4): 0}
     landscape = Landscape(terrain, height)
-    GraphicBattle(army_1, army_2, landscape, 600, "testing_out").do(10)
+    run_battle(army_1, army_2, landscape, 600)
 
 
 def test_G3():
@@ -382,7 +392,7 @@ def test_G3():
               (1.45, 2): -1}
     landscape = Landscape(terrain, height)
 
-    GraphicBattle(army_1, army_2, landscape, 720, "testing_out").do(verbosity=10)
+    run_battle(army_1, army_2, landscape, 720)
 
 
 """ Testing Stances"""
@@ -407,7 +417,7 @@ def test_H1():
     # Check all combinations of stances look reasonable
     army_1, army_2, terrain = utils_for_H_tests(Stance.AGG, Stance.BAL)
     landscape = Landscape(terrain, {})
-    GraphicBattle(army_1, army_2, landscape, 800, "testing_out").do(10)
+    run_battle(army_1, army_2, landscape, 800)
 
 
 def test_H2():
@@ -424,7 +434,7 @@ def test_H2():
               (-1.6, -7.5): 0,
               (1.2, -6.5): 3}
     landscape = Landscape(terrain, height)
-    GraphicBattle(army_1, army_2, landscape, 920, "testing_out").do(10)
+    run_battle(army_1, army_2, landscape, 920)
 
 
 def test_H3():
@@ -441,7 +451,7 @@ def test_H3():
               (-1.6, -7.5): 0,
               (1.2, -6.5): 5}
     landscape = Landscape(terrain, height)
-    GraphicBattle(army_1, army_2, landscape, 920, "testing_out").do(10)
+    run_battle(army_1, army_2, landscape, 920)
 
 
 def test_H4():
@@ -451,7 +461,8 @@ def test_H4():
     army_2.add(-2, mixed).add(-1, mixed).add(0, mixed)
 
     landscape = PresetLandscapes.rolling_green()
-    GraphicBattle(army_1, army_2, landscape, 920, "testing_out").do(10)
+    run_battle(army_1, army_2, landscape, 920)
 
 
-test_H4()
+if __name__ == "__main__":
+    test_H4()